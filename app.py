@@ -1,33 +1,51 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import random
+import re
+import sqlite3
 import time
+import hashlib
 import io
-import numpy as np
-from datetime import datetime, timedelta
+import math
+import os
+import importlib.util
+import threading
+from datetime import datetime
 from typing import Optional, Dict, List, Any
-import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from collections import deque, OrderedDict
 
 # -----------------------------
-# PIL (Safe Import)
+# orjson (Optional, faster JSON encoding/decoding)
 # -----------------------------
 try:
-    from PIL import Image as PILImage
-except Exception:
-    PILImage = None
-    st.error("Pillow is missing. Add 'Pillow' to requirements.txt")
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 # -----------------------------
-# Google Drive (Safe Import)
+# Google Drive (Lazy Import)
 # -----------------------------
+# The Google client stack is slow to import, so the Drive helpers import it
+# on first use. Only check here that it is installed.
 try:
-    from google.oauth2 import service_account
-    from googleapiclient.discovery import build
-    from googleapiclient.http import MediaIoBaseUpload
-except Exception:
-    service_account = None
-    build = None
-    MediaIoBaseUpload = None
+    GOOGLE_API_AVAILABLE = all(
+        importlib.util.find_spec(name) is not None
+        for name in ("google.oauth2", "googleapiclient", "google_auth_httplib2", "httplib2")
+    )
+except ModuleNotFoundError:
+    GOOGLE_API_AVAILABLE = False
+
+if not GOOGLE_API_AVAILABLE:
     st.error("Google API packages missing. Add these to requirements.txt: "
              "google-auth, google-auth-oauthlib, google-auth-httplib2, google-api-python-client")
 
@@ -183,14 +201,133 @@ st.markdown("""
 # ============================================================================
 
 BASE_URL = "https://api.kie.ai/api/v1/jobs"
+CREATE_TASK_URL = f"{BASE_URL}/createTask"
+RECORD_INFO_URL = f"{BASE_URL}/recordInfo"
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Drive uploads: small files go up in a single multipart request, larger ones
+# use a resumable session with an explicit chunk size.
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Drive library listing: page size per files.list call and overall cap
+LIBRARY_PAGE_SIZE = 1000
+LIBRARY_MAX_FILES = 1000
+
+# Longest edge of library previews, in pixels, and how many are kept in memory
+THUMBNAIL_SIZE = 400
+THUMBNAIL_CACHE_SIZE = 512
+
+# Full-size result images kept in memory for History previews and uploads
+RESULT_IMAGE_CACHE_SIZE = 32
+
+# Library page controls: option value -> label
+LIBRARY_SORT_OPTIONS = {
+    'date_desc': '📅 Newest First',
+    'date_asc': '📅 Oldest First',
+    'name_asc': '🔤 Name A-Z',
+    'name_desc': '🔤 Name Z-A'
+}
+LIBRARY_FILTER_OPTIONS = {
+    'all': '🖼️ All Types',
+    'png': '🖼️ PNG Only',
+    'jpg': '🖼️ JPG Only',
+    'webp': '🖼️ WebP Only'
+}
+LIBRARY_VIEW_OPTIONS = {
+    'grid': '⊞ Grid View',
+    'list': '≡ List View'
+}
+
+LIBRARY_PAGE_SIZES = (12, 24, 48)
+
+# Library type filter -> accepted MIME types
+LIBRARY_MIME_FILTERS = {
+    'png': ('image/png',),
+    'jpg': ('image/jpeg', 'image/jpg'),
+    'webp': ('image/webp',)
+}
+
+# Generation form choices
+TEXT_TO_IMAGE_MODELS = ("stable-diffusion-xl", "dall-e-3", "midjourney-v6")
+QWEN_IMAGE_SIZES = ("square", "square_hd", "portrait_4_3", "portrait_16_9", "landscape_4_3", "landscape_16_9")
+QWEN_ACCELERATION_OPTIONS = ("none", "regular", "high")
+SEEDREAM_IMAGE_SIZES = ("square", "square_hd", "portrait_4_3", "portrait_3_2", "portrait_16_9",
+                        "landscape_4_3", "landscape_3_2", "landscape_16_9", "landscape_21_9")
+SEEDREAM_RESOLUTIONS = ("1K", "2K", "4K")
+
+# Task History table status markers
+HISTORY_STATUS_ICONS = {'waiting': '🟡', 'processing': '🟡', 'success': '🟢', 'fail': '🔴'}
+
+# Drive caps each appProperties entry (key + value) at 124 bytes
+APP_PROPERTY_MAX_BYTES = 124
+
+# Drive rejects batch requests with more than 100 calls
+DRIVE_BATCH_LIMIT = 100
+
+# Background task polling: give up after this long, and how often the
+# progress widget on the History page refreshes while a poll is running
+POLL_TIMEOUT = 180
+POLL_REFRESH_INTERVAL = 0.5
+POLL_WORKERS = 16
+MAX_SESSION_POLLS = 4  # per session, so one History page can't fill the poll pool
+
+# Identical createTask requests this close together are treated as one
+DUPLICATE_SUBMIT_WINDOW = 30
+
+# Finished task records kept in memory, across sessions
+TASK_RESULT_CACHE_SIZE = 256
+
+# (connect, read) timeouts for API and image requests: fail fast on an
+# unreachable host, but give slow responses room
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Oldest tasks fall off the history once this many are stored
+MAX_TASK_HISTORY = 500
+
+# Shared worker pool for I/O-bound download/upload jobs
+# (st.cache_resource keeps one instance across reruns; module globals are
+# rebuilt every time Streamlit re-executes the script)
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8)
+
+EXECUTOR = get_executor()
+
+# Task polls spend minutes mostly sleeping, so they get their own pool and
+# never hold up thumbnails, uploads or deletes on the shared one
+@st.cache_resource
+def get_poll_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=POLL_WORKERS)
+
+POLL_EXECUTOR = get_poll_executor()
+
+# Pooled HTTP session so polling and downloads reuse keep-alive connections.
+# Retry only covers idempotent methods, so createTask POSTs are never replayed.
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True
+        )
+    ))
+    return session
+
+SESSION = get_http_session()
+
 # ============================================================================
 # Prompt Library Data
 # ============================================================================
 
 PROMPT_LIBRARY = {
-    "E-commerce Mockups": [
+    "E-commerce Mockups": (
         "Product photo of a white t-shirt on wooden table, studio lighting, 4K",
         "Professional coffee mug mockup on desk with laptop, morning light",
         "Phone case mockup with marble background, clean and minimal",
@@ -216,8 +353,8 @@ PROMPT_LIBRARY = {
         "Packaging box mockup with eco-friendly design, sustainable brand",
         "Gift card mockup on festive background, holiday season",
         "Shopping bag mockup on city street, retail photography"
-    ],
-    "Backgrounds": [
+    ),
+    "Backgrounds": (
         "Abstract gradient background, purple to blue, smooth transitions",
         "Minimalist white marble texture, luxury aesthetic, high resolution",
         "Wooden desk texture, natural oak, warm tones, top view",
@@ -243,8 +380,8 @@ PROMPT_LIBRARY = {
         "Snowy landscape, winter wonderland, pristine white",
         "Autumn forest path, fallen leaves, warm color palette",
         "Cherry blossom trees, spring bloom, soft pink petals"
-    ],
-    "Image Edits": [
+    ),
+    "Image Edits": (
         "Make the image more vibrant and increase color saturation",
         "Add cinematic color grading with teal and orange tones",
         "Remove background and make it transparent or white",
@@ -270,8 +407,8 @@ PROMPT_LIBRARY = {
         "Make colors pop like Instagram filter, highly saturated",
         "Add vignette effect, darken edges around image",
         "Transform to look like a watercolor painting"
-    ],
-    "Professional Position Changes": [
+    ),
+    "Professional Position Changes": (
         "Change person's position to standing confidently with arms crossed",
         "Make subject sitting at desk working on laptop, professional pose",
         "Position person giving presentation, pointing at screen",
@@ -297,29 +434,37 @@ PROMPT_LIBRARY = {
         "Make subject pointing forward, leadership gesture",
         "Position with one hand in pocket, casual confident",
         "Change to welcoming gesture with open arms"
-    ]
+    )
 }
 
+PROMPT_CATEGORIES = tuple(PROMPT_LIBRARY.keys())
+PROMPT_CATEGORY_INDEX = {category: i for i, category in enumerate(PROMPT_CATEGORIES)}
+
 # ============================================================================
 # Session State Initialization
 # ============================================================================
 
-def init_session_state():
-    """Initialize all session state variables."""
-    defaults = {
+def session_defaults() -> Dict[str, Any]:
+    """Fresh default values for a new session (only built on its first run)."""
+    return {
         'api_key': "",
-        'task_history': [],
+        'task_history': deque(maxlen=MAX_TASK_HISTORY),  # newest first
         'current_task': None,
         'authenticated': False,
         'service': None,
         'credentials': None,
+        'service_key': None,
         'generated_images': [],
         'library_images': [],
         'gdrive_folder_id': None,
         'auto_upload': True,
-        'polling_active': False,
+        'poll_jobs': {},  # task_id -> (future, status) for background polls
+        'recent_submissions': OrderedDict(),  # request hash -> (task_id, time) for duplicate clicks
+        'pending_deletes': [],  # futures of background Drive deletes
+        'confirm_clear_history': False,
         'service_account_info': None,
         'upload_queue': [],
+        'upload_hashes': {},  # sha256 of uploaded bytes -> Drive file id
         'stats': {
             'total_tasks': 0,
             'successful_tasks': 0,
@@ -334,22 +479,36 @@ def init_session_state():
         'library_sort_by': 'date_desc',  # date_desc, date_asc, name_asc, name_desc
         'library_search_query': '',
         'library_filter_type': 'all',  # all, png, jpg, webp
+        'library_page': 0,
+        'library_page_size': 24,
+        'library_selected': set(),  # file ids ticked for bulk delete
         'selected_images': [],  # for batch operations
         'show_image_modal': False,
         'modal_image_data': None,
-        'custom_prompts': {
-            "E-commerce Mockups": [],
-            "Backgrounds": [],
-            "Image Edits": [],
-            "Professional Position Changes": []
-        },
-        'selected_prompt_category': "E-commerce Mockups",
+        'custom_prompts': {category: [] for category in PROMPT_CATEGORIES},
+        'selected_prompt_category': PROMPT_CATEGORIES[0],
         'prompt_library_search': ''
     }
+
+# Session keys that are also widget keys. Streamlit drops widget state when
+# the widget isn't rendered, so these are re-assigned every run to survive
+# navigating away from the page that shows them.
+WIDGET_STATE_KEYS = ('library_sort_by', 'library_filter_type', 'library_view_mode', 'library_page_size')
+
+def init_session_state():
+    """Initialize all session state variables.
+    
+    Defaults are only built on a session's first run; later reruns just
+    re-assign the widget-backed keys.
+    """
+    if not st.session_state.get('session_initialized'):
+        for key, value in session_defaults().items():
+            if key not in st.session_state:
+                st.session_state[key] = value
+        st.session_state.session_initialized = True
     
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    for key in WIDGET_STATE_KEYS:
+        st.session_state[key] = st.session_state[key]
 
 init_session_state()
 
@@ -357,14 +516,32 @@ init_session_state()
 # Google Drive Functions with Service Account
 # ============================================================================
 
+def get_drive_service(service_account_json):
+    """Return (credentials, service) for a service account, building the client once.
+    
+    The built resource is reused as long as the session keeps the same
+    service account key, so re-authenticating skips ``build()`` entirely.
+    """
+    service_key = (service_account_json.get('client_email'), service_account_json.get('private_key_id'))
+    if st.session_state.service is not None and st.session_state.get('service_key') == service_key:
+        return st.session_state.credentials, st.session_state.service
+    
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    
+    credentials = service_account.Credentials.from_service_account_info(
+        service_account_json,
+        scopes=SCOPES
+    )
+    service = build('drive', 'v3', credentials=credentials,
+                    cache_discovery=False, static_discovery=True)
+    st.session_state.service_key = service_key
+    return credentials, service
+
 def authenticate_with_service_account(service_account_json):
     """Authenticate with Google Drive using service account."""
     try:
-        credentials = service_account.Credentials.from_service_account_info(
-            service_account_json,
-            scopes=SCOPES
-        )
-        service = build('drive', 'v3', credentials=credentials)
+        credentials, service = get_drive_service(service_account_json)
         st.session_state.credentials = credentials
         st.session_state.service = service
         st.session_state.authenticated = True
@@ -372,112 +549,492 @@ def authenticate_with_service_account(service_account_json):
     except Exception as e:
         return False, f"Authentication failed: {str(e)}"
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def find_or_create_app_folder(service_key: tuple, _service) -> str:
+    """Id of the app's Drive folder for a service account, creating it if needed.
+    
+    Cached per service account (``_service`` is not hashed), so new sessions
+    and reconnects with the same key skip the Drive lookup. Errors propagate
+    and are not cached; ``forget_app_folder_if_missing`` drops the entry once
+    the folder turns out to be gone.
+    """
+    results = _service.files().list(
+        q="name='AI_Image_Editor_Pro' and mimeType='application/vnd.google-apps.folder' and trashed=false",
+        spaces='drive',
+        fields='files(id, name)',
+        pageSize=1
+    ).execute()
+    
+    files = results.get('files', [])
+    if files:
+        return files[0]['id']
+    
+    file_metadata = {
+        'name': 'AI_Image_Editor_Pro',
+        'mimeType': 'application/vnd.google-apps.folder'
+    }
+    folder = _service.files().create(
+        body=file_metadata,
+        fields='id'
+    ).execute()
+    return folder['id']
+
 def create_app_folder():
     """Create or get the app's folder in Google Drive."""
     if not st.session_state.service:
         return None
     
     try:
-        results = st.session_state.service.files().list(
-            q="name='AI_Image_Editor_Pro' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            spaces='drive',
-            fields='files(id, name)',
-            pageSize=1
-        ).execute()
-        
-        files = results.get('files', [])
-        if files:
-            st.session_state.gdrive_folder_id = files[0]['id']
-            return files[0]['id']
-        
-        file_metadata = {
-            'name': 'AI_Image_Editor_Pro',
-            'mimeType': 'application/vnd.google-apps.folder'
-        }
-        folder = st.session_state.service.files().create(
-            body=file_metadata,
-            fields='id'
-        ).execute()
-        
-        folder_id = folder.get('id')
-        st.session_state.gdrive_folder_id = folder_id
-        return folder_id
+        folder_id = find_or_create_app_folder(st.session_state.service_key, st.session_state.service)
     except Exception as e:
         st.error(f"Error creating folder: {str(e)}")
         return None
+    
+    st.session_state.gdrive_folder_id = folder_id
+    return folder_id
 
-def upload_to_gdrive(image_url: str, file_name: str, task_id: str = None):
-    """Download image from URL and upload to Google Drive with public access."""
-    if not st.session_state.service:
+def forget_app_folder_if_missing(error: Exception):
+    """Drop the cached folder id after Drive answered 404 for it (e.g. trashed).
+    
+    Called on the script thread with a worker's upload error; the next upload
+    looks the folder up (or recreates it) again.
+    """
+    if getattr(getattr(error, 'resp', None), 'status', None) == 404:
+        find_or_create_app_folder.clear()
+        st.session_state.gdrive_folder_id = None
+
+def build_media_upload(buffer, mime_type: str):
+    """Build a media body sized for the payload (single-shot for small files).
+    
+    ``buffer`` is raw bytes or a seekable file object; file objects are handed
+    to the uploader as-is rather than copied into a fresh BytesIO.
+    """
+    from googleapiclient.http import MediaIoBaseUpload
+    
+    if isinstance(buffer, (bytes, bytearray)):
+        buffer = io.BytesIO(buffer)
+    
+    buffer.seek(0, io.SEEK_END)
+    size = buffer.tell()
+    buffer.seek(0)
+    
+    if size < RESUMABLE_UPLOAD_THRESHOLD:
+        return MediaIoBaseUpload(buffer, mimetype=mime_type, resumable=False)
+    return MediaIoBaseUpload(
+        buffer,
+        mimetype=mime_type,
+        chunksize=UPLOAD_CHUNK_SIZE,
+        resumable=True
+    )
+
+def download_image(image_url: str):
+    """Return an image as an in-memory buffer ready for upload.
+    
+    Returns ``(buffer, mime_type)``; ``mime_type`` is the server's image
+    Content-Type, or ``None`` if it didn't send one. Bytes come from
+    ``fetch_image``, so an image already shown or uploaded isn't downloaded
+    again.
+    """
+    data, mime_type = fetch_image(image_url)
+    return io.BytesIO(data), mime_type
+
+def make_thumbnail(image_data: bytes, max_size: int = THUMBNAIL_SIZE) -> bytes:
+    """Downscale encoded image bytes to a WebP preview no larger than ``max_size``."""
+    from PIL import Image as PILImage
+    
+    image = PILImage.open(io.BytesIO(image_data))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    image.thumbnail((max_size, max_size))
+    
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=80)
+    return buffer.getvalue()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def upload_preview(file_id: str, _image_data: bytes) -> bytes:
+    """Thumbnail for a file in the uploader, keyed by its uploader id so the
+    (possibly large) bytes are never hashed."""
+    return make_thumbnail(_image_data)
+
+# Executor threads can't use st.cache_data, so caches they share are plain
+# locked LRUs built by new_lru_cache and held as cached resources
+def new_lru_cache() -> Dict[str, Any]:
+    return {'lock': threading.Lock(), 'items': OrderedDict(), 'hits': 0, 'misses': 0}
+
+def lru_get(cache: Dict[str, Any], key):
+    """Return the cached value for ``key`` (refreshing its recency), or ``None``."""
+    with cache['lock']:
+        if key in cache['items']:
+            cache['hits'] += 1
+            cache['items'].move_to_end(key)
+            return cache['items'][key]
+        cache['misses'] += 1
         return None
+
+def lru_put(cache: Dict[str, Any], key, value, max_entries: int):
+    """Store ``value`` under ``key``, evicting the least recently used entries."""
+    with cache['lock']:
+        cache['items'][key] = value
+        cache['items'].move_to_end(key)
+        while len(cache['items']) > max_entries:
+            cache['items'].popitem(last=False)
+
+@st.cache_resource
+def get_thumbnail_cache() -> Dict[str, Any]:
+    return new_lru_cache()
+
+THUMBNAILS = get_thumbnail_cache()
+
+def fetch_thumbnail(image_url: str, max_size: int = THUMBNAIL_SIZE) -> bytes:
+    """Fetch an image once and return a small WebP preview of it.
     
-    try:
-        folder_id = st.session_state.gdrive_folder_id or create_app_folder()
-        if not folder_id:
-            return None
-        
-        response = requests.get(image_url, timeout=30)
+    Library views render these instead of handing full-size URLs to the
+    browser. Safe to call from worker threads. Raises on download/decode
+    errors so callers can fall back to the next URL.
+    """
+    key = (image_url, max_size)
+    data = lru_get(THUMBNAILS, key)
+    if data is not None:
+        return data
+    
+    response = SESSION.get(image_url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = make_thumbnail(response.content, max_size)
+    
+    lru_put(THUMBNAILS, key, data, THUMBNAIL_CACHE_SIZE)
+    return data
+
+@st.cache_resource
+def get_result_image_cache() -> Dict[str, Any]:
+    return new_lru_cache()
+
+RESULT_IMAGES = get_result_image_cache()
+
+def fetch_image(image_url: str):
+    """Full image bytes and image MIME type (or ``None``) for a URL.
+    
+    Streamed once and kept in ``RESULT_IMAGES``; safe to call from worker
+    threads, so History previews and Drive uploads share the same copy.
+    """
+    cached = lru_get(RESULT_IMAGES, image_url)
+    if cached is not None:
+        return cached
+    
+    buffer = io.BytesIO()
+    with SESSION.get(image_url, stream=True, timeout=REQUEST_TIMEOUT) as response:
         response.raise_for_status()
-        image_data = response.content
-        
-        mime_type = 'image/png'
-        if file_name.lower().endswith('.jpg') or file_name.lower().endswith('.jpeg'):
-            mime_type = 'image/jpeg'
-        elif file_name.lower().endswith('.webp'):
-            mime_type = 'image/webp'
-        
-        file_metadata = {
-            'name': file_name,
-            'parents': [folder_id]
-        }
-        
-        media = MediaIoBaseUpload(
-            io.BytesIO(image_data),
-            mimetype=mime_type,
-            resumable=True
-        )
-        
-        file = st.session_state.service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id, name, webViewLink, webContentLink, mimeType'
-        ).execute()
-        
-        file_id = file.get('id')
-        
-        permission = {
-            'type': 'anyone',
-            'role': 'reader'
-        }
-        st.session_state.service.permissions().create(
-            fileId=file_id,
-            body=permission
-        ).execute()
-        
-        public_image_url = f"https://drive.google.com/uc?export=view&id={file_id}"
-        thumbnail_url = f"https://drive.google.com/thumbnail?id={file_id}&sz=w400"
-        
-        st.session_state.stats['uploaded_images'] += 1
-        
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            buffer.write(chunk)
+    
+    result = (buffer.getvalue(), content_type if content_type.startswith('image/') else None)
+    lru_put(RESULT_IMAGES, image_url, result, RESULT_IMAGE_CACHE_SIZE)
+    return result
+
+def fetch_image_bytes(image_url: str) -> bytes:
+    """Full image bytes for a result URL, fetched once and reused across reruns."""
+    return fetch_image(image_url)[0]
+
+def thumbnail_cache_stats() -> Dict[str, Any]:
+    """Entry count, byte size and hit/miss counters of the thumbnail cache."""
+    with THUMBNAILS['lock']:
         return {
-            'file_id': file_id,
-            'file_name': file.get('name'),
-            'web_link': file.get('webViewLink'),
-            'content_link': file.get('webContentLink'),
-            'public_image_url': public_image_url,
-            'thumbnail_url': thumbnail_url,
-            'mime_type': file.get('mimeType'),
-            'uploaded_at': datetime.now().isoformat(),
-            'task_id': task_id,
-            'original_url': image_url,  # Original source URL from generation
-            'id': file_id,
-            'name': file.get('name')
+            'entries': len(THUMBNAILS['items']),
+            'bytes': sum(len(data) for data in THUMBNAILS['items'].values()),
+            'hits': THUMBNAILS['hits'],
+            'misses': THUMBNAILS['misses']
         }
+
+def clear_media_caches():
+    """Drop cached thumbnails and result images (the Drive listing is left alone)."""
+    with THUMBNAILS['lock']:
+        THUMBNAILS['items'].clear()
+        THUMBNAILS['hits'] = THUMBNAILS['misses'] = 0
+    with RESULT_IMAGES['lock']:
+        RESULT_IMAGES['items'].clear()
+
+def tile_thumbnail(file_info: Dict) -> Optional[bytes]:
+    """Thumbnail for a library tile, or ``None`` if no source URL works.
+    
+    Small pre-rendered Drive thumbnails are tried first; full-size URLs are
+    only fallbacks.
+    """
+    urls_to_try = (
+        file_info.get('thumbnailLink'),  # Drive pre-rendered thumbnail
+        file_info.get('thumbnail_url'),  # Google Drive thumbnail
+        file_info.get('original_url'),  # Original generation URL (full resolution)
+        file_info.get('public_image_url'),  # Google Drive public URL
+        file_info.get('direct_link')  # Google Drive direct link
+    )
+    for url in urls_to_try:
+        if url:
+            try:
+                return fetch_thumbnail(url)
+            except Exception:
+                continue
+    return None
+
+def content_digest(buffer) -> str:
+    """SHA-256 of an in-memory file, read through a view instead of a copy."""
+    with buffer.getbuffer() as view:
+        return hashlib.sha256(view).hexdigest()
+
+def guess_mime_type(file_name: str) -> str:
+    """Map an image file name to its MIME type (PNG by default)."""
+    lower_name = file_name.lower()
+    if lower_name.endswith('.jpg') or lower_name.endswith('.jpeg'):
+        return 'image/jpeg'
+    if lower_name.endswith('.webp'):
+        return 'image/webp'
+    return 'image/png'
+
+def make_files_public(file_ids: List[str]):
+    """Grant 'anyone with the link' read access to files in one batch request."""
+    if not file_ids:
+        return
+    
+    failed = []
+    
+    def _on_permission(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+    
+    for start in range(0, len(file_ids), DRIVE_BATCH_LIMIT):
+        batch = st.session_state.service.new_batch_http_request(callback=_on_permission)
+        for file_id in file_ids[start:start + DRIVE_BATCH_LIMIT]:
+            batch.add(
+                st.session_state.service.permissions().create(
+                    fileId=file_id,
+                    body={'type': 'anyone', 'role': 'reader'}
+                ),
+                request_id=file_id
+            )
+        batch.execute()
+    
+    if failed:
+        st.warning(f"Could not make {len(failed)} file(s) public")
+
+def build_app_properties(**values) -> Dict[str, str]:
+    """Build Drive appProperties, skipping entries over Drive's 124-byte limit."""
+    return {
+        key: str(value) for key, value in values.items()
+        if value and len(key.encode('utf-8')) + len(str(value).encode('utf-8')) <= APP_PROPERTY_MAX_BYTES
+    }
+
+# Per-thread transport cache; cached as a resource so it outlives script reruns
+# just like the executor threads that use it
+@st.cache_resource
+def get_worker_http_cache() -> threading.local:
+    return threading.local()
+
+WORKER_HTTP = get_worker_http_cache()
+
+def authorized_http(credentials):
+    """Authorized transport for the calling worker thread.
+    
+    httplib2 is not thread-safe, so each thread gets its own; it is kept per
+    thread and reused while the credentials stay the same, so later uploads
+    from that thread skip the TCP/TLS handshake.
+    """
+    import google_auth_httplib2
+    import httplib2
+    
+    cached = getattr(WORKER_HTTP, 'value', None)
+    if cached is None or cached[0] is not credentials:
+        cached = (credentials, google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http()))
+        WORKER_HTTP.value = cached
+    return cached[1]
+
+def drive_file_info(file: Dict[str, Any], task_id: Optional[str],
+                    original_url: Optional[str]) -> Dict[str, Any]:
+    """Upload info for a file just created in Drive.
+    
+    ``original_url`` is the generation source URL; files without one (local
+    uploads) point back at their own Drive URL.
+    """
+    file_id = file.get('id')
+    public_image_url = f"https://drive.google.com/uc?export=view&id={file_id}"
+    
+    return {
+        'file_id': file_id,
+        'file_name': file.get('name'),
+        'web_link': file.get('webViewLink'),
+        'content_link': file.get('webContentLink'),
+        'public_image_url': public_image_url,
+        'thumbnail_url': f"https://drive.google.com/thumbnail?id={file_id}&sz=w400",
+        'mime_type': file.get('mimeType'),
+        'uploaded_at': datetime.now().isoformat(),
+        'task_id': task_id,
+        'original_url': original_url or public_image_url,
+        'id': file_id,
+        'name': file.get('name')
+    }
+
+def _download_and_upload(service, credentials, folder_id: str, image_url: str,
+                         file_name: str, task_id: Optional[str]):
+    """Worker: fetch one image and create it in Drive.
+    
+    Runs off the script thread, so it must not touch ``st``. Requests go
+    through ``authorized_http``, which reuses one transport per worker thread.
+    """
+    image_buffer, mime_type = download_image(image_url)
+    
+    file_metadata = {
+        'name': file_name,
+        'parents': [folder_id],
+        'appProperties': build_app_properties(original_url=image_url, task_id=task_id)
+    }
+    
+    # Uploaded as downloaded, labelled with the type the server actually sent
+    media = build_media_upload(image_buffer, mime_type or guess_mime_type(file_name))
+    http = authorized_http(credentials)
+    
+    file = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields='id, name, webViewLink, webContentLink, mimeType'
+    ).execute(http=http)
+    
+    return drive_file_info(file, task_id, image_url)
+
+def _upload_local_file(service, credentials, folder_id: str, buffer, file_name: str):
+    """Worker: create one user-supplied image in Drive.
+    
+    Like ``_download_and_upload`` this runs off the script thread and must
+    not touch ``st``.
+    """
+    file_metadata = {
+        'name': file_name,
+        'parents': [folder_id]
+    }
+    
+    media = build_media_upload(buffer, guess_mime_type(file_name))
+    http = authorized_http(credentials)
+    
+    file = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields='id, name, webViewLink, webContentLink, mimeType, createdTime, size'
+    ).execute(http=http)
+    
+    info = drive_file_info(file, None, None)
+    info.update({
+        'createdTime': file.get('createdTime'),
+        'size': file.get('size'),
+        'mimeType': file.get('mimeType'),
+        'thumbnailLink': info['thumbnail_url'],
+        'direct_link': f"https://lh3.googleusercontent.com/d/{info['file_id']}"
+    })
+    return info
+
+def upload_to_gdrive_many(items: List[tuple]):
+    """Download and upload several images in parallel, then share them in a single batch.
+    
+    Each item is an ``(image_url, file_name, task_id)`` tuple. Returns the
+    upload info for every file that made it to Drive, in input order.
+    """
+    if not st.session_state.service or not items:
+        return []
+    
+    folder_id = st.session_state.gdrive_folder_id or create_app_folder()
+    if not folder_id:
+        return []
+    
+    service = st.session_state.service
+    credentials = st.session_state.credentials
+    futures = {
+        EXECUTOR.submit(_download_and_upload, service, credentials, folder_id,
+                        image_url, file_name, task_id): idx
+        for idx, (image_url, file_name, task_id) in enumerate(items)
+    }
+    
+    results = [None] * len(items)
+    for future in as_completed(futures):
+        idx = futures[future]
+        try:
+            results[idx] = future.result()
+        except Exception as e:
+            forget_app_folder_if_missing(e)
+            st.error(f"Error uploading {items[idx][1]} to Google Drive: {str(e)}")
+    uploaded = [info for info in results if info]
+    
+    try:
+        make_files_public([info['file_id'] for info in uploaded])
     except Exception as e:
-        st.error(f"Error uploading to Google Drive: {str(e)}")
-        return None
+        st.warning(f"Error sharing uploaded files: {str(e)}")
+    
+    if uploaded:
+        invalidate_gdrive_cache()
+    st.session_state.stats['uploaded_images'] += len(uploaded)
+    return uploaded
+
+def upload_to_gdrive(image_url: str, file_name: str, task_id: str = None):
+    """Download image from URL and upload to Google Drive with public access."""
+    uploaded = upload_to_gdrive_many([(image_url, file_name, task_id)])
+    return uploaded[0] if uploaded else None
 
-def list_gdrive_images(folder_id: Optional[str] = None):
+# Listing cache tokens per folder; shared by every session so a change made
+# in one session is not hidden from another by the process-wide data cache
+@st.cache_resource
+def get_drive_cache_versions() -> Dict[str, int]:
+    return {}
+
+DRIVE_CACHE_VERSIONS = get_drive_cache_versions()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_gdrive_images(_service, folder_id: str, cache_version: int = 0):
+    """Fetch image metadata for a Drive folder.
+    
+    Cached per folder; ``_service`` is not hashed and ``cache_version`` is
+    the folder's token in ``DRIVE_CACHE_VERSIONS``.
+    """
+    files = []
+    page_token = None
+    while len(files) < LIBRARY_MAX_FILES:
+        results = _service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false and (mimeType='image/png' or mimeType='image/jpeg' or mimeType='image/webp' or mimeType='image/jpg')",
+            spaces='drive',
+            fields='nextPageToken, files(id, name, createdTime, size, mimeType, thumbnailLink, appProperties)',
+            pageSize=LIBRARY_PAGE_SIZE,
+            orderBy='createdTime desc',
+            pageToken=page_token
+        ).execute()
+        
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    
+    files = files[:LIBRARY_MAX_FILES]
+    
+    for file in files:
+        file_id = file['id']
+        # Links are deterministic from the file id, so they are not requested
+        file['webViewLink'] = f"https://drive.google.com/file/d/{file_id}/view"
+        # Lowercased once here so search and name sorting don't redo it per rerun
+        file['name_lower'] = file.get('name', '').lower()
+        app_properties = file.pop('appProperties', {})
+        if 'original_url' in app_properties:
+            file['original_url'] = app_properties['original_url']
+        if 'task_id' in app_properties:
+            file['task_id'] = app_properties['task_id']
+        file['public_image_url'] = f"https://drive.google.com/uc?export=view&id={file_id}"
+        file['thumbnail_url'] = f"https://drive.google.com/thumbnail?id={file_id}&sz=w{THUMBNAIL_SIZE}"
+        if file.get('thumbnailLink'):
+            # Drive serves its pre-rendered thumbnail at any size via the =sNNN suffix
+            file['thumbnailLink'] = re.sub(r'=s\d+$', f'=s{THUMBNAIL_SIZE}', file['thumbnailLink'])
+        file['direct_link'] = f"https://lh3.googleusercontent.com/d/{file_id}"
+    
+    return files
+
+def invalidate_gdrive_cache():
+    """Make the next listing bypass the cache after the folder contents change."""
+    folder_id = st.session_state.gdrive_folder_id
+    if folder_id:
+        DRIVE_CACHE_VERSIONS[folder_id] = time.monotonic_ns()
+
+def list_gdrive_images(folder_id: Optional[str] = None, refresh: bool = False):
     """List all images in Google Drive folder."""
     if not st.session_state.service:
         return []
@@ -486,50 +1043,182 @@ def list_gdrive_images(folder_id: Optional[str] = None):
         if not folder_id:
             folder_id = st.session_state.gdrive_folder_id or create_app_folder()
         
-        results = st.session_state.service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false and (mimeType='image/png' or mimeType='image/jpeg' or mimeType='image/webp' or mimeType='image/jpg')",
-            spaces='drive',
-            fields='files(id, name, webContentLink, webViewLink, createdTime, size, mimeType, thumbnailLink)',
-            pageSize=100,
-            orderBy='createdTime desc'
-        ).execute()
-        
-        files = results.get('files', [])
+        if refresh:
+            DRIVE_CACHE_VERSIONS[folder_id] = time.monotonic_ns()
         
-        for file in files:
-            file_id = file['id']
-            file['public_image_url'] = f"https://drive.google.com/uc?export=view&id={file_id}"
-            file['thumbnail_url'] = f"https://drive.google.com/thumbnail?id={file_id}&sz=w400"
-            file['direct_link'] = f"https://lh3.googleusercontent.com/d/{file_id}"
-        
-        return files
+        return fetch_gdrive_images(st.session_state.service, folder_id,
+                                   DRIVE_CACHE_VERSIONS.get(folder_id, 0))
     except Exception as e:
         st.error(f"Error listing images: {str(e)}")
         return []
 
-def delete_gdrive_file(file_id: str):
-    """Delete a file from Google Drive."""
-    if not st.session_state.service:
-        return False
+def _delete_drive_files(service, credentials, file_ids: List[str]):
+    """Worker: delete Drive files through batch requests.
     
-    try:
-        st.session_state.service.files().delete(fileId=file_id).execute()
-        return True
-    except Exception as e:
-        st.error(f"Error deleting file: {str(e)}")
-        return False
+    Runs off the script thread, so it must not touch ``st``. Returns the
+    ``(deleted, failed)`` id lists.
+    """
+    deleted = []
+    failed = []
+    
+    def _on_delete(request_id, response, exception):
+        (failed if exception is not None else deleted).append(request_id)
+    
+    http = authorized_http(credentials)
+    for start in range(0, len(file_ids), DRIVE_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=_on_delete)
+        for file_id in file_ids[start:start + DRIVE_BATCH_LIMIT]:
+            batch.add(service.files().delete(fileId=file_id), request_id=file_id)
+        try:
+            batch.execute(http=http)
+        except Exception:
+            done = set(deleted) | set(failed)
+            failed.extend(fid for fid in file_ids[start:start + DRIVE_BATCH_LIMIT] if fid not in done)
+    
+    return deleted, failed
+
+def delete_library_images(file_ids: List[str]):
+    """Remove images from the library now and delete them from Drive in the background.
+    
+    The tiles disappear immediately; ``collect_finished_deletes`` reconciles
+    with Drive once the batch delete completes.
+    """
+    if not st.session_state.service or not file_ids:
+        return
+    
+    future = EXECUTOR.submit(_delete_drive_files, st.session_state.service,
+                             st.session_state.credentials, list(file_ids))
+    st.session_state.pending_deletes.append(future)
+    
+    removed = set(file_ids)
+    st.session_state.library_images = [
+        img for img in st.session_state.library_images if img.get('id') not in removed
+    ]
+    # Let the same bytes be uploaded again now that the Drive copy is gone
+    st.session_state.upload_hashes = {
+        digest: fid for digest, fid in st.session_state.upload_hashes.items() if fid not in removed
+    }
+    clear_library_selection(removed)
+
+def collect_finished_deletes():
+    """Report finished background deletes and restore files Drive refused to delete."""
+    pending = st.session_state.pending_deletes
+    finished = [future for future in pending if future.done()]
+    if not finished:
+        return
+    
+    st.session_state.pending_deletes = [future for future in pending if future not in finished]
+    invalidate_gdrive_cache()
+    
+    failed = 0
+    for future in finished:
+        try:
+            failed += len(future.result()[1])
+        except Exception:
+            failed += 1
+    
+    if failed:
+        st.warning(f"Could not delete {failed} file(s); reloading the library from Drive")
+        st.session_state.library_images = list_gdrive_images()
+
+def short_timestamp(iso_timestamp: str) -> str:
+    """``YYYY-MM-DD HH:MM`` from an ISO 8601 timestamp, by slicing rather than parsing."""
+    return iso_timestamp[:16].replace('T', ' ')
+
+def library_signature(images: List[Dict]) -> tuple:
+    """Cheap identity for the library list, used to key derived views.
+    
+    Refreshes and deletes replace the list and uploads insert at the front,
+    so list identity, length and first id together change on every edit.
+    """
+    return (id(images), len(images), images[0].get('id') if images else None)
+
+def filter_and_sort_library(search_query: str, filter_type: str, sort_by: str) -> List[Dict]:
+    """Return the valid library images matching the current filters, sorted.
+    
+    The result is kept in session state keyed by the filter settings and the
+    library signature, so reruns that don't touch them skip the work.
+    """
+    images = st.session_state.library_images
+    cache_key = (library_signature(images), search_query, filter_type, sort_by)
+    cached = st.session_state.get('library_view_cache')
+    if cached and cached[0] == cache_key:
+        return cached[1]
+    
+    filtered_images = [img for img in images if img and 'name' in img and 'id' in img]
+    
+    if search_query:
+        query = search_query.lower()
+        filtered_images = [img for img in filtered_images
+                           if query in (img.get('name_lower') or img['name'].lower())]
+    
+    if filter_type != 'all':
+        target_mimes = LIBRARY_MIME_FILTERS[filter_type]
+        filtered_images = [img for img in filtered_images
+                           if img.get('mimeType') in target_mimes]
+    
+    # library_images is kept newest-first (Drive lists by createdTime desc and
+    # uploads are inserted at the front), so date order needs no sort
+    if sort_by == 'date_asc':
+        filtered_images.reverse()
+    elif sort_by in ('name_asc', 'name_desc'):
+        filtered_images.sort(key=lambda x: x.get('name_lower') or x['name'].lower(),
+                             reverse=sort_by == 'name_desc')
+    
+    st.session_state.library_view_cache = (cache_key, filtered_images)
+    return filtered_images
+
+def get_library_options():
+    """Return ``(names, by_name, index_by_id)`` for the library image selectboxes.
+    
+    Duplicate file names get a short id suffix so every label is unique. The
+    result is kept in session state and only rebuilt when the library changes.
+    """
+    images = st.session_state.library_images
+    signature = library_signature(images)
+    cached = st.session_state.get('library_options_cache')
+    if cached and cached[0] == signature:
+        return cached[1]
+    
+    names = []
+    by_name = {}
+    index_by_id = {}
+    for i, img in enumerate(images):
+        name = img.get('name', f"Image {i}")
+        if name in by_name:
+            name = f"{name} ({str(img.get('id', i))[:6]})"
+        index_by_id[img.get('id')] = len(names)
+        names.append(name)
+        by_name[name] = img
+    
+    options = (tuple(names), by_name, index_by_id)
+    st.session_state.library_options_cache = (signature, options)
+    return options
 
 # ============================================================================
 # API Functions
 # ============================================================================
 
+def auth_headers(api_key: str) -> Dict[str, str]:
+    """Bearer headers for an API key.
+    
+    Built per request rather than set on the shared SESSION because every
+    visitor brings their own key; nothing keeps the raw key around.
+    """
+    return {"Authorization": f"Bearer {api_key}"}
+
+def json_post_headers(api_key: str) -> Dict[str, str]:
+    """``auth_headers`` plus the Content-Type for pre-encoded JSON bodies."""
+    return {**auth_headers(api_key), "Content-Type": "application/json"}
+
 def create_task(api_key, model, input_params, callback_url=None):
-    """Create a generation task."""
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    """Create a generation task.
     
+    Resubmitting an identical request within ``DUPLICATE_SUBMIT_WINDOW``
+    seconds (a double click, a rerun) returns the task already created
+    instead of paying for a second one; the result then has ``duplicate``
+    set.
+    """
     payload = {
         "model": model,
         "input": input_params
@@ -538,105 +1227,267 @@ def create_task(api_key, model, input_params, callback_url=None):
     if callback_url:
         payload["callBackUrl"] = callback_url
     
+    submit_key = hashlib.sha1(
+        f"{api_key_hash(api_key)}:{json.dumps(payload, sort_keys=True)}".encode('utf-8')
+    ).hexdigest()
+    recent = st.session_state.recent_submissions
+    now = time.monotonic()
+    while recent and now - next(iter(recent.values()))[1] > DUPLICATE_SUBMIT_WINDOW:
+        recent.popitem(last=False)
+    if submit_key in recent:
+        return {"success": True, "task_id": recent[submit_key][0], "duplicate": True}
+    
     try:
-        response = requests.post(
-            f"{BASE_URL}/createTask",
-            headers=headers,
-            json=payload,
-            timeout=30
+        response = SESSION.post(
+            CREATE_TASK_URL,
+            headers=json_post_headers(api_key),
+            data=json_dumps(payload),
+            timeout=REQUEST_TIMEOUT
         )
         
-        data = response.json()
-        if response.status_code == 200:
-            if data.get("code") == 200:
-                st.session_state.stats['total_tasks'] += 1
-                return {"success": True, "task_id": data["data"]["taskId"]}
-            else:
-                return {"success": False, "error": data.get('msg', 'Unknown error')}
-        else:
+        if response.status_code != 200:
             return {"success": False, "error": f"HTTP {response.status_code}: {response.text}"}
+        
+        data = json_loads(response.content)
+        if data["code"] != 200:
+            return {"success": False, "error": data.get('msg') or 'Unknown error'}
+        task_id = data["data"]["taskId"]
+    except (KeyError, TypeError, ValueError):
+        return {"success": False, "error": "Malformed response from createTask"}
     except Exception as e:
         return {"success": False, "error": str(e)}
+    
+    recent[submit_key] = (task_id, now)
+    st.session_state.stats['total_tasks'] += 1
+    return {"success": True, "task_id": task_id}
+
+# Finished tasks never change state, so their recordInfo is kept; keyed by
+# API key hash as well so one key can't read another key's results
+@st.cache_resource
+def get_task_result_cache() -> Dict[str, Any]:
+    return new_lru_cache()
+
+TASK_RESULTS = get_task_result_cache()
 
 def check_task_status(api_key, task_id):
-    """Check task status."""
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-    }
+    """Check task status.
+    
+    Results for tasks in a terminal state are served from ``TASK_RESULTS``.
+    """
+    cache_key = (api_key_hash(api_key), task_id)
+    task_data = lru_get(TASK_RESULTS, cache_key)
+    if task_data is not None:
+        return {"success": True, "data": task_data}
     
     try:
-        response = requests.get(
-            f"{BASE_URL}/recordInfo",
-            headers=headers,
+        response = SESSION.get(
+            RECORD_INFO_URL,
+            headers=auth_headers(api_key),
             params={"taskId": task_id},
-            timeout=30
+            timeout=REQUEST_TIMEOUT
         )
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == 200:
-                return {"success": True, "data": data["data"]}
-            else:
-                return {"success": False, "error": data.get('msg', 'Unknown error')}
-        else:
+        if response.status_code != 200:
             return {"success": False, "error": f"HTTP {response.status_code}"}
+        
+        data = json_loads(response.content)
+        if data["code"] != 200:
+            return {"success": False, "error": data.get('msg') or 'Unknown error'}
+        task_data = data["data"]
+        state = task_data["state"]
+    except (KeyError, TypeError, ValueError):
+        return {"success": False, "error": "Malformed response from recordInfo"}
     except Exception as e:
         return {"success": False, "error": str(e)}
+    
+    if state in ('success', 'fail'):
+        lru_put(TASK_RESULTS, cache_key, task_data, TASK_RESULT_CACHE_SIZE)
+    return {"success": True, "data": task_data}
 
-def poll_task_until_complete(api_key, task_id, max_attempts=60, delay=2):
-    """Poll task status until completion or timeout."""
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+def _poll_task_worker(api_key, task_id, status, timeout=POLL_TIMEOUT, initial_delay=0.25, max_delay=4.0):
+    """Worker: poll a task with exponential backoff until it finishes.
     
-    for attempt in range(max_attempts):
+    Runs off the script thread, so progress is reported through the plain
+    ``status`` dict instead of Streamlit widgets.
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    
+    while time.monotonic() - start < timeout:
         result = check_task_status(api_key, task_id)
+        status['attempts'] += 1
+        status['elapsed'] = time.monotonic() - start
         
         if result["success"]:
             task_data = result["data"]
-            state = task_data["state"]
-            
-            progress = min((attempt + 1) / max_attempts, 0.95)
-            progress_bar.progress(progress)
-            status_text.text(f"Status: {state} | Attempt {attempt + 1}/{max_attempts}")
+            status['state'] = task_data["state"]
             
-            if state == "success":
-                progress_bar.progress(1.0)
-                status_text.text("✅ Task completed successfully!")
+            if task_data["state"] == "success":
                 return {"success": True, "data": task_data}
-            elif state == "fail":
-                progress_bar.empty()
-                status_text.text("❌ Task failed")
+            elif task_data["state"] == "fail":
                 return {"success": False, "error": task_data.get('failMsg', 'Unknown error'), "data": task_data}
-            
-            time.sleep(delay)
         else:
-            status_text.text(f"⚠️ Error checking status: {result['error']}")
-            time.sleep(delay)
+            status['state'] = f"error ({result['error']})"
+        
+        # +/-20% jitter keeps polls started together (Check all pending) from
+        # hitting the API in lockstep
+        time.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 1.5, max_delay)
+    
+    return {"success": False, "error": "Timeout reached"}
+
+def start_task_polling(api_key, task_id) -> bool:
+    """Start polling a task in the background unless it is already being polled.
+    
+    Returns False when the session already runs ``MAX_SESSION_POLLS`` polls.
+    """
+    if task_id in st.session_state.poll_jobs:
+        return True
+    if len(st.session_state.poll_jobs) >= MAX_SESSION_POLLS:
+        return False
+    
+    status = {'state': 'waiting', 'attempts': 0, 'elapsed': 0.0}
+    future = POLL_EXECUTOR.submit(_poll_task_worker, api_key, task_id, status)
+    st.session_state.poll_jobs[task_id] = (future, status)
+    return True
+
+def parse_result_urls(task_data):
+    """Extract result URLs from a finished task.
+    
+    ``resultJson`` is normally a JSON string embedded in the response, but is
+    used directly when the API already returns it as an object.
+    """
+    result_json = task_data.get('resultJson') or {}
+    if not isinstance(result_json, dict):
+        result_json = json_loads(result_json)
+    return result_json.get('resultUrls', [])
+
+# ============================================================================
+# Task History Persistence
+# ============================================================================
+
+# Task history survives reconnects by being mirrored to a local SQLite file,
+# partitioned by a hash of the API key so users only ever see their own tasks
+TASK_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai_image_editor", "state.sqlite")
+
+@st.cache_resource
+def get_task_store() -> Optional[Dict[str, Any]]:
+    """Open the shared task store, or ``None`` if the disk isn't writable."""
+    try:
+        os.makedirs(os.path.dirname(TASK_STORE_PATH), exist_ok=True)
+        conn = sqlite3.connect(TASK_STORE_PATH, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "api_hash TEXT NOT NULL, task_id TEXT PRIMARY KEY, model TEXT, prompt TEXT, "
+            "created_at TEXT, status TEXT, results TEXT, error TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_key ON tasks (api_hash, created_at)")
+        conn.commit()
+    except (OSError, sqlite3.Error):
+        return None
+    return {'lock': threading.Lock(), 'conn': conn}
+
+def api_key_hash(api_key: str) -> str:
+    """Stable store key for an API key that doesn't reveal the key itself."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+
+def persist_task(task: Dict):
+    """Insert or update one history entry in the task store (best effort)."""
+    store = get_task_store()
+    if store is None or not st.session_state.api_key:
+        return
+    
+    row = (api_key_hash(st.session_state.api_key), task['id'], task['model'], task['prompt'],
+           task['created_at'], task['status'], json_dumps(task.get('results', [])).decode('utf-8'),
+           task.get('error'))
+    try:
+        with store['lock']:
+            store['conn'].execute("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            store['conn'].commit()
+    except sqlite3.Error:
+        pass
+
+def load_task_history(api_key: str) -> deque:
+    """Rebuild the newest-first task history saved for ``api_key``."""
+    history = deque(maxlen=MAX_TASK_HISTORY)
+    store = get_task_store()
+    if store is None or not api_key:
+        return history
     
-    progress_bar.empty()
-    status_text.text("⏱️ Timeout reached")
-    return {"success": False, "error": "Timeout reached"}
+    try:
+        with store['lock']:
+            rows = store['conn'].execute(
+                "SELECT task_id, model, prompt, created_at, status, results, error FROM tasks "
+                "WHERE api_hash = ? ORDER BY created_at DESC LIMIT ?",
+                (api_key_hash(api_key), MAX_TASK_HISTORY)
+            ).fetchall()
+    except sqlite3.Error:
+        return history
+    
+    for task_id, model, prompt, created_at, status, results, error in rows:
+        task = {
+            "id": task_id,
+            "model": model,
+            "prompt": prompt,
+            "status": status,
+            "created_at": created_at,
+            "results": json_loads(results) if results else []
+        }
+        if error:
+            task['error'] = error
+        history.append(task)
+    return history
+
+def clear_persisted_history(api_key: str):
+    """Drop every stored task for ``api_key``."""
+    store = get_task_store()
+    if store is None or not api_key:
+        return
+    
+    try:
+        with store['lock']:
+            store['conn'].execute("DELETE FROM tasks WHERE api_hash = ?", (api_key_hash(api_key),))
+            store['conn'].commit()
+    except sqlite3.Error:
+        pass
 
 # ============================================================================
 # Helper function to auto-upload and save results
 # ============================================================================
 
+def record_new_task(task_id, model, prompt):
+    """Add a freshly created task to the front of the bounded history."""
+    if any(task['id'] == task_id for task in st.session_state.task_history):
+        return  # a duplicate submit handed back an existing task
+    task = {
+        "id": task_id,
+        "model": model,
+        "prompt": prompt,
+        "status": "waiting",
+        "created_at": datetime.now().isoformat(),
+        "results": []
+    }
+    st.session_state.task_history.appendleft(task)
+    persist_task(task)
+
 def save_and_upload_results(task_id, model, prompt, result_urls):
     """Save results to history and auto-upload to Google Drive if enabled."""
-    for i, task in enumerate(st.session_state.task_history):
+    for task in st.session_state.task_history:
         if task['id'] == task_id:
-            st.session_state.task_history[i]['status'] = 'success'
-            st.session_state.task_history[i]['results'] = result_urls
+            task['status'] = 'success'
+            task['results'] = result_urls
+            persist_task(task)
             st.session_state.stats['successful_tasks'] += 1
             st.session_state.stats['total_images'] += len(result_urls)
             
             if st.session_state.authenticated and st.session_state.auto_upload:
-                for j, result_url in enumerate(result_urls):
-                    file_name = f"{model.replace('/', '_')}_{task_id}_{j+1}.png"
-                    upload_info = upload_to_gdrive(result_url, file_name, task_id)
-                    if upload_info:
-                        st.session_state.library_images.insert(0, upload_info)
-                        st.success(f"✅ Auto-uploaded {file_name} to Google Drive!")
+                items = [
+                    (result_url, f"{model.replace('/', '_')}_{task_id}_{j+1}.png", task_id)
+                    for j, result_url in enumerate(result_urls)
+                ]
+                for upload_info in upload_to_gdrive_many(items):
+                    st.session_state.library_images.insert(0, upload_info)
+                    st.success(f"✅ Auto-uploaded {upload_info['file_name']} to Google Drive!")
             break
 
 # ============================================================================
@@ -646,6 +1497,8 @@ def save_and_upload_results(task_id, model, prompt, result_urls):
 def handle_api_key_change():
     """Callback to handle API key change and store it in session state."""
     st.session_state.api_key = st.session_state.api_key_input
+    # Bring back this key's tasks from earlier sessions
+    st.session_state.task_history = load_task_history(st.session_state.api_key)
 
 def handle_service_account_upload():
     """Callback to handle service account JSON upload."""
@@ -735,13 +1588,14 @@ with st.sidebar:
         
         with col2:
             if st.button("🔄 Refresh", use_container_width=True):
-                st.session_state.library_images = list_gdrive_images()
+                st.session_state.library_images = list_gdrive_images(refresh=True)
                 st.success("Refreshed!")
         
         if st.button("🗑️ Disconnect", use_container_width=True):
             st.session_state.authenticated = False
             st.session_state.service = None
             st.session_state.credentials = None
+            st.session_state.service_key = None
             st.session_state.service_account_info = None
             st.rerun()
     
@@ -762,6 +1616,17 @@ with st.sidebar:
     success_rate = (stats['successful_tasks'] / stats['total_tasks'] * 100) if stats['total_tasks'] > 0 else 0
     st.metric("Success Rate", f"{success_rate:.1f}%")
     
+    with st.expander("🧠 Cache"):
+        cache_stats = thumbnail_cache_stats()
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        hit_rate = cache_stats['hits'] / lookups * 100 if lookups else 0
+        st.caption(f"Thumbnails: {cache_stats['entries']}/{THUMBNAIL_CACHE_SIZE} entries, "
+                   f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB")
+        st.caption(f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · Hit rate: {hit_rate:.0f}%")
+        if st.button("Clear image caches", key="clear_media_caches", use_container_width=True):
+            clear_media_caches()
+            st.rerun()
+    
     st.markdown("---")
     
     st.header("🚀 Quick Actions")
@@ -778,11 +1643,25 @@ with st.sidebar:
         st.session_state.current_page = "Prompt Library"
         st.rerun()
     
+    # The confirmation lives in session state: a widget nested under the
+    # button would vanish on the rerun its own click triggers
     if st.button("🗑️ Clear History", use_container_width=True):
-        if st.checkbox("Confirm clear history"):
-            st.session_state.task_history = []
-            st.success("History cleared!")
-            st.rerun()
+        st.session_state.confirm_clear_history = True
+    
+    if st.session_state.confirm_clear_history:
+        st.warning("Delete all task history, including the saved copy?")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Confirm", key="confirm_clear_history_yes", use_container_width=True):
+                st.session_state.task_history.clear()
+                clear_persisted_history(st.session_state.api_key)
+                st.session_state.confirm_clear_history = False
+                st.success("History cleared!")
+                st.rerun()
+        with col2:
+            if st.button("Cancel", key="confirm_clear_history_no", use_container_width=True):
+                st.session_state.confirm_clear_history = False
+                st.rerun()
     
     st.markdown("---")
     st.markdown("Developed by AI Assistant")
@@ -807,9 +1686,8 @@ def display_prompt_library_page():
     st.markdown("---")
     
     # Category tabs
-    categories = list(PROMPT_LIBRARY.keys())
-    selected_tab = st.selectbox("📂 Select Category", categories, 
-                                 index=categories.index(st.session_state.selected_prompt_category))
+    selected_tab = st.selectbox("📂 Select Category", PROMPT_CATEGORIES, 
+                                 index=PROMPT_CATEGORY_INDEX[st.session_state.selected_prompt_category])
     st.session_state.selected_prompt_category = selected_tab
     
     # Search box
@@ -823,7 +1701,7 @@ def display_prompt_library_page():
     # Get prompts for selected category
     default_prompts = PROMPT_LIBRARY[selected_tab]
     custom_prompts = st.session_state.custom_prompts.get(selected_tab, [])
-    all_prompts = default_prompts + custom_prompts
+    all_prompts = list(chain(default_prompts, custom_prompts))
     
     # Filter prompts by search
     if search_query:
@@ -917,379 +1795,498 @@ def display_prompt_library_page():
                 
                 st.markdown("</div>", unsafe_allow_html=True)
 
-def display_generate_page():
-    st.title("✨ Generate New Image")
-    
-    if 'selected_prompt_for_generation' in st.session_state and st.session_state.get('selected_prompt_for_generation'):
-        st.success(f"📋 Using prompt from library: {st.session_state.selected_prompt_for_generation[:60]}...")
-        if st.button("❌ Clear Selected Prompt"):
-            st.session_state.selected_prompt_for_generation = None
-            st.rerun()
+@st.fragment
+def render_text_to_image_tab():
+    """Render the Text-to-Image tab."""
+    st.header("Text-to-Image Generation")
     
-    if st.session_state.selected_image_for_edit and st.session_state.edit_mode:
-        st.info(f"📷 Image selected for editing: {st.session_state.selected_image_for_edit.get('name', 'Unknown')}")
-        if st.button("❌ Clear Selection"):
-            st.session_state.selected_image_for_edit = None
-            st.session_state.edit_mode = None
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        if st.button("📚 Browse Prompt Library", use_container_width=True):
+            st.session_state.current_page = "Prompt Library"
             st.rerun()
     
-    if not st.session_state.api_key:
-        st.error("Please configure your API Key in the sidebar to start generating images.")
-        return
-
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Text-to-Image", "Image Edit (Qwen)", "Image Edit (Seedream)", "Upload Images", "Advanced"])
-
-    with tab1:
-        st.header("Text-to-Image Generation")
+    with st.form("text_to_image_form"):
+        default_prompt = st.session_state.get('selected_prompt_for_generation', 
+                                              "A photorealistic image of a majestic lion wearing a crown, digital art, highly detailed")
+        prompt = st.text_area("Prompt", default_prompt)
+        negative_prompt = st.text_area("Negative Prompt (Optional)", "blurry, low quality, bad anatomy")
         
-        col1, col2 = st.columns([3, 1])
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            model = st.selectbox("Model", TEXT_TO_IMAGE_MODELS, index=0, key="txt2img_model")
         with col2:
-            if st.button("📚 Browse Prompt Library", use_container_width=True):
-                st.session_state.current_page = "Prompt Library"
-                st.rerun()
+            width = st.slider("Width", 512, 1024, 1024, step=64, key="txt2img_width")
+        with col3:
+            height = st.slider("Height", 512, 1024, 1024, step=64, key="txt2img_height")
         
-        with st.form("text_to_image_form"):
-            default_prompt = st.session_state.get('selected_prompt_for_generation', 
-                                                  "A photorealistic image of a majestic lion wearing a crown, digital art, highly detailed")
-            prompt = st.text_area("Prompt", default_prompt)
-            negative_prompt = st.text_area("Negative Prompt (Optional)", "blurry, low quality, bad anatomy")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                model = st.selectbox("Model", ["stable-diffusion-xl", "dall-e-3", "midjourney-v6"], index=0, key="txt2img_model")
-            with col2:
-                width = st.slider("Width", 512, 1024, 1024, step=64, key="txt2img_width")
-            with col3:
-                height = st.slider("Height", 512, 1024, 1024, step=64, key="txt2img_height")
+        num_images = st.slider("Number of Images", 1, 4, 1, key="txt2img_num")
+        
+        submitted = st.form_submit_button("Generate Image")
+        
+        if submitted:
+            if 'selected_prompt_for_generation' in st.session_state:
+                st.session_state.selected_prompt_for_generation = None
             
-            num_images = st.slider("Number of Images", 1, 4, 1, key="txt2img_num")
+            input_params = {
+                "prompt": prompt,
+                "negative_prompt": negative_prompt,
+                "width": width,
+                "height": height,
+                "num_images": num_images
+            }
             
-            submitted = st.form_submit_button("Generate Image")
+            with st.spinner("Creating task..."):
+                result = create_task(st.session_state.api_key, model, input_params)
             
-            if submitted:
-                if 'selected_prompt_for_generation' in st.session_state:
-                    st.session_state.selected_prompt_for_generation = None
-                
-                input_params = {
-                    "prompt": prompt,
-                    "negative_prompt": negative_prompt,
-                    "width": width,
-                    "height": height,
-                    "num_images": num_images
-                }
+            if result["success"]:
+                task_id = result["task_id"]
+                # Also recorded for duplicates: a double click can interrupt the
+                # first run before it got this far (ids already in history are skipped)
+                record_new_task(task_id, model, prompt)
+                st.session_state.current_task = task_id
                 
-                with st.spinner("Creating task..."):
-                    result = create_task(st.session_state.api_key, model, input_params)
-                
-                if result["success"]:
-                    task_id = result["task_id"]
+                if result.get("duplicate"):
+                    st.info(f"Identical request already submitted; reusing task {task_id}.")
+                else:
                     st.info(f"Task created successfully. Task ID: {task_id}")
-                    
-                    st.session_state.task_history.insert(0, {
-                        "id": task_id,
-                        "model": model,
-                        "prompt": prompt,
-                        "status": "waiting",
-                        "created_at": datetime.now().isoformat(),
-                        "results": []
-                    })
-                    st.session_state.current_task = task_id
                     st.rerun()
-                else:
-                    st.error(f"Failed to create task: {result['error']}")
+            else:
+                st.error(f"Failed to create task: {result['error']}")
 
-    with tab2:
-        st.header("Image Edit - Qwen Model")
-        st.info("Edit images using the Qwen Image Edit model")
-        
-        default_qwen_url = st.session_state.selected_image_for_edit.get('public_image_url', 
-            "https://file.aiquickdraw.com/custom-page/akr/section-images/1755603225969i6j87xnw.jpg") if st.session_state.selected_image_for_edit else "https://file.aiquickdraw.com/custom-page/akr/section-images/1755603225969i6j87xnw.jpg"
+@st.fragment
+def render_qwen_edit_tab():
+    """Render the Image Edit (Qwen) tab."""
+    st.header("Image Edit - Qwen Model")
+    st.info("Edit images using the Qwen Image Edit model")
+    
+    default_qwen_url = st.session_state.selected_image_for_edit.get('public_image_url', 
+        "https://file.aiquickdraw.com/custom-page/akr/section-images/1755603225969i6j87xnw.jpg") if st.session_state.selected_image_for_edit else "https://file.aiquickdraw.com/custom-page/akr/section-images/1755603225969i6j87xnw.jpg"
+    
+    with st.form("qwen_image_edit_form"):
+        prompt = st.text_area("Edit Prompt", "Make the image more vibrant and colorful", key="qwen_prompt")
+        negative_prompt = st.text_area("Negative Prompt (Optional)", "blurry, ugly", key="qwen_neg_prompt")
         
-        with st.form("qwen_image_edit_form"):
-            prompt = st.text_area("Edit Prompt", "Make the image more vibrant and colorful", key="qwen_prompt")
-            negative_prompt = st.text_area("Negative Prompt (Optional)", "blurry, ugly", key="qwen_neg_prompt")
+        if st.session_state.authenticated and st.session_state.library_images:
+            use_library_image = st.checkbox("📚 Use image from library", value=bool(st.session_state.selected_image_for_edit))
             
-            if st.session_state.authenticated and st.session_state.library_images:
-                use_library_image = st.checkbox("📚 Use image from library", value=bool(st.session_state.selected_image_for_edit))
-                
-                if use_library_image:
-                    library_options = {img.get('name', f"Image {i}"): img for i, img in enumerate(st.session_state.library_images)}
-                    default_selection_name = st.session_state.selected_image_for_edit.get('name') if st.session_state.selected_image_for_edit else None
-                    if default_selection_name not in library_options:
-                         default_selection_name = list(library_options.keys())[0] if library_options else ""
-
-                    selected_name = st.selectbox("Select Image", options=list(library_options.keys()), 
-                                                key="qwen_library_select", index=list(library_options.keys()).index(default_selection_name) if default_selection_name in library_options else 0)
-                    selected_img = library_options[selected_name]
-                    image_url = selected_img.get('public_image_url', '')
-                    st.image(image_url, caption=selected_name, width=200)
-                else:
-                    image_url = st.text_input("Image URL", default_qwen_url, key="qwen_image_url")
+            if use_library_image:
+                names, by_name, index_by_id = get_library_options()
+                selected_id = st.session_state.selected_image_for_edit.get('id') if st.session_state.selected_image_for_edit else None
+
+                selected_name = st.selectbox("Select Image", options=names,
+                                            key="qwen_library_select", index=index_by_id.get(selected_id, 0))
+                selected_img = by_name[selected_name]
+                image_url = selected_img.get('public_image_url', '')
+                # Preview from Drive's small thumbnail; the API still gets the full image
+                st.image(selected_img.get('thumbnailLink') or image_url, caption=selected_name, width=200)
             else:
                 image_url = st.text_input("Image URL", default_qwen_url, key="qwen_image_url")
+        else:
+            image_url = st.text_input("Image URL", default_qwen_url, key="qwen_image_url")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            image_size = st.selectbox("Image Size", QWEN_IMAGE_SIZES, index=1, key="qwen_size")
+        with col2:
+            num_steps = st.slider("Inference Steps", 2, 49, 25, key="qwen_steps")
+        with col3:
+            guidance_scale = st.slider("Guidance Scale", 0.0, 20.0, 4.0, key="qwen_guidance")
+        
+        acceleration = st.selectbox("Acceleration", QWEN_ACCELERATION_OPTIONS, index=0, key="qwen_accel")
+        
+        submitted = st.form_submit_button("Edit Image (Qwen)")
+        
+        if submitted:
+            input_params = {
+                "prompt": prompt,
+                "image_url": image_url,
+                "negative_prompt": negative_prompt,
+                "image_size": image_size,
+                "num_inference_steps": num_steps,
+                "guidance_scale": guidance_scale,
+                "acceleration": acceleration,
+                "enable_safety_checker": True,
+                "output_format": "png"
+            }
             
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                image_size = st.selectbox("Image Size", ["square", "square_hd", "portrait_4_3", "portrait_16_9", "landscape_4_3", "landscape_16_9"], index=1, key="qwen_size")
-            with col2:
-                num_steps = st.slider("Inference Steps", 2, 49, 25, key="qwen_steps")
-            with col3:
-                guidance_scale = st.slider("Guidance Scale", 0.0, 20.0, 4.0, key="qwen_guidance")
-            
-            acceleration = st.selectbox("Acceleration", ["none", "regular", "high"], index=0, key="qwen_accel")
-            
-            submitted = st.form_submit_button("Edit Image (Qwen)")
+            with st.spinner("Creating edit task..."):
+                result = create_task(st.session_state.api_key, "qwen/image-edit", input_params)
             
-            if submitted:
-                input_params = {
-                    "prompt": prompt,
-                    "image_url": image_url,
-                    "negative_prompt": negative_prompt,
-                    "image_size": image_size,
-                    "num_inference_steps": num_steps,
-                    "guidance_scale": guidance_scale,
-                    "acceleration": acceleration,
-                    "enable_safety_checker": True,
-                    "output_format": "png"
-                }
+            if result["success"]:
+                task_id = result["task_id"]
+                record_new_task(task_id, "qwen/image-edit", prompt)
+                st.session_state.current_task = task_id
+                st.session_state.selected_image_for_edit = None
+                st.session_state.edit_mode = None
                 
-                with st.spinner("Creating edit task..."):
-                    result = create_task(st.session_state.api_key, "qwen/image-edit", input_params)
-                
-                if result["success"]:
-                    task_id = result["task_id"]
+                if result.get("duplicate"):
+                    st.info(f"Identical request already submitted; reusing task {task_id}.")
+                else:
                     st.info(f"Task created successfully. Task ID: {task_id}")
-                    
-                    st.session_state.task_history.insert(0, {
-                        "id": task_id,
-                        "model": "qwen/image-edit",
-                        "prompt": prompt,
-                        "status": "waiting",
-                        "created_at": datetime.now().isoformat(),
-                        "results": []
-                    })
-                    st.session_state.current_task = task_id
-                    st.session_state.selected_image_for_edit = None
-                    st.session_state.edit_mode = None
                     st.rerun()
-                else:
-                    st.error(f"Failed to create task: {result['error']}")
+            else:
+                st.error(f"Failed to create task: {result['error']}")
 
-    with tab3:
-        st.header("Image Edit - Seedream V4 Model")
-        st.info("Advanced image editing using Seedream V4 with multiple image inputs")
-        
-        default_seedream_url = st.session_state.selected_image_for_edit.get('public_image_url',
-            "https://file.aiquickdraw.com/custom-page/akr/section-images/1757930552966e7f2on7s.png") if st.session_state.selected_image_for_edit else "https://file.aiquickdraw.com/custom-page/akr/section-images/1757930552966e7f2on7s.png"
+@st.fragment
+def render_seedream_edit_tab():
+    """Render the Image Edit (Seedream V4) tab."""
+    st.header("Image Edit - Seedream V4 Model")
+    st.info("Advanced image editing using Seedream V4 with multiple image inputs")
+    
+    default_seedream_url = st.session_state.selected_image_for_edit.get('public_image_url',
+        "https://file.aiquickdraw.com/custom-page/akr/section-images/1757930552966e7f2on7s.png") if st.session_state.selected_image_for_edit else "https://file.aiquickdraw.com/custom-page/akr/section-images/1757930552966e7f2on7s.png"
+    
+    with st.form("seedream_image_edit_form"):
+        prompt = st.text_area("Edit Prompt", "Create a tshirt mock up with this logo", key="seedream_prompt")
         
-        with st.form("seedream_image_edit_form"):
-            prompt = st.text_area("Edit Prompt", "Create a tshirt mock up with this logo", key="seedream_prompt")
+        if st.session_state.authenticated and st.session_state.library_images:
+            use_library_image = st.checkbox("📚 Use image from library", value=bool(st.session_state.selected_image_for_edit))
             
-            if st.session_state.authenticated and st.session_state.library_images:
-                use_library_image = st.checkbox("📚 Use image from library", value=bool(st.session_state.selected_image_for_edit))
-                
-                if use_library_image:
-                    library_options = {img.get('name', f"Image {i}"): img for i, img in enumerate(st.session_state.library_images)}
-                    default_selection_name = st.session_state.selected_image_for_edit.get('name') if st.session_state.selected_image_for_edit else None
-                    if default_selection_name not in library_options:
-                         default_selection_name = list(library_options.keys())[0] if library_options else ""
-
-                    selected_name = st.selectbox("Select Image", options=list(library_options.keys()),
-                                                key="seedream_library_select", index=list(library_options.keys()).index(default_selection_name) if default_selection_name in library_options else 0)
-                    selected_img = library_options[selected_name]
-                    image_url = selected_img.get('public_image_url', '')
-                    st.image(image_url, caption=selected_name, width=200)
-                else:
-                    image_url = st.text_input("Image URL", default_seedream_url, key="seedream_image_url")
+            if use_library_image:
+                names, by_name, index_by_id = get_library_options()
+                selected_id = st.session_state.selected_image_for_edit.get('id') if st.session_state.selected_image_for_edit else None
+
+                selected_name = st.selectbox("Select Image", options=names,
+                                            key="seedream_library_select", index=index_by_id.get(selected_id, 0))
+                selected_img = by_name[selected_name]
+                image_url = selected_img.get('public_image_url', '')
+                # Preview from Drive's small thumbnail; the API still gets the full image
+                st.image(selected_img.get('thumbnailLink') or image_url, caption=selected_name, width=200)
             else:
                 image_url = st.text_input("Image URL", default_seedream_url, key="seedream_image_url")
+        else:
+            image_url = st.text_input("Image URL", default_seedream_url, key="seedream_image_url")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            image_size = st.selectbox("Image Size", SEEDREAM_IMAGE_SIZES, index=1, key="seedream_size")
+        with col2:
+            image_resolution = st.selectbox("Image Resolution", SEEDREAM_RESOLUTIONS, index=0, key="seedream_res")
+        with col3:
+            max_images = st.slider("Max Images", 1, 6, 1, key="seedream_max_images")
+        
+        submitted = st.form_submit_button("Edit Image (Seedream V4)")
+        
+        if submitted:
+            input_params = {
+                "prompt": prompt,
+                "image_urls": [image_url],
+                "image_size": image_size,
+                "image_resolution": image_resolution,
+                "max_images": max_images
+            }
             
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                image_size = st.selectbox("Image Size", ["square", "square_hd", "portrait_4_3", "portrait_3_2", "portrait_16_9", "landscape_4_3", "landscape_3_2", "landscape_16_9", "landscape_21_9"], index=1, key="seedream_size")
-            with col2:
-                image_resolution = st.selectbox("Image Resolution", ["1K", "2K", "4K"], index=0, key="seedream_res")
-            with col3:
-                max_images = st.slider("Max Images", 1, 6, 1, key="seedream_max_images")
-            
-            submitted = st.form_submit_button("Edit Image (Seedream V4)")
+            with st.spinner("Creating Seedream edit task..."):
+                result = create_task(st.session_state.api_key, "bytedance/seedream-v4-edit", input_params)
             
-            if submitted:
-                input_params = {
-                    "prompt": prompt,
-                    "image_urls": [image_url],
-                    "image_size": image_size,
-                    "image_resolution": image_resolution,
-                    "max_images": max_images
-                }
+            if result["success"]:
+                task_id = result["task_id"]
+                record_new_task(task_id, "bytedance/seedream-v4-edit", prompt)
+                st.session_state.current_task = task_id
+                st.session_state.selected_image_for_edit = None
+                st.session_state.edit_mode = None
                 
-                with st.spinner("Creating Seedream edit task..."):
-                    result = create_task(st.session_state.api_key, "bytedance/seedream-v4-edit", input_params)
-                
-                if result["success"]:
-                    task_id = result["task_id"]
+                if result.get("duplicate"):
+                    st.info(f"Identical request already submitted; reusing task {task_id}.")
+                else:
                     st.info(f"Task created successfully. Task ID: {task_id}")
-                    
-                    st.session_state.task_history.insert(0, {
-                        "id": task_id,
-                        "model": "bytedance/seedream-v4-edit",
-                        "prompt": prompt,
-                        "status": "waiting",
-                        "created_at": datetime.now().isoformat(),
-                        "results": []
-                    })
-                    st.session_state.current_task = task_id
-                    st.session_state.selected_image_for_edit = None
-                    st.session_state.edit_mode = None
                     st.rerun()
-                else:
-                    st.error(f"Failed to create task: {result['error']}")
+            else:
+                st.error(f"Failed to create task: {result['error']}")
 
-    with tab4:
-        st.header("📤 Upload Your Images")
-        st.info("Upload images from your computer to Google Drive library")
+@st.fragment
+def render_upload_tab():
+    """Render the Upload Images tab."""
+    st.header("📤 Upload Your Images")
+    st.info("Upload images from your computer to Google Drive library")
+    
+    if not st.session_state.authenticated:
+        st.warning("⚠️ Please connect your Google Drive account in the sidebar to upload images.")
+    else:
+        uploaded_files = st.file_uploader(
+            "Choose images to upload",
+            type=['png', 'jpg', 'jpeg', 'webp'],
+            accept_multiple_files=True,
+            key="image_uploader"
+        )
         
-        if not st.session_state.authenticated:
-            st.warning("⚠️ Please connect your Google Drive account in the sidebar to upload images.")
-        else:
-            uploaded_files = st.file_uploader(
-                "Choose images to upload",
-                type=['png', 'jpg', 'jpeg', 'webp'],
-                accept_multiple_files=True,
-                key="image_uploader"
-            )
+        if uploaded_files:
+            st.markdown(f"**{len(uploaded_files)} file(s) selected**")
             
-            if uploaded_files:
-                st.markdown(f"**{len(uploaded_files)} file(s) selected**")
-                
-                preview_cols = st.columns(min(len(uploaded_files), 4))
-                for idx, uploaded_file in enumerate(uploaded_files[:4]):
-                    with preview_cols[idx]:
-                        st.image(uploaded_file, caption=uploaded_file.name, use_container_width=True)
-                
-                if len(uploaded_files) > 4:
-                    st.info(f"And {len(uploaded_files) - 4} more file(s)...")
+            preview_cols = st.columns(min(len(uploaded_files), 4))
+            for idx, uploaded_file in enumerate(uploaded_files[:4]):
+                with preview_cols[idx]:
+                    try:
+                        preview = upload_preview(uploaded_file.file_id, uploaded_file.getvalue())
+                    except Exception:
+                        preview = uploaded_file
+                    st.image(preview, caption=uploaded_file.name, use_container_width=True)
+            
+            if len(uploaded_files) > 4:
+                st.info(f"And {len(uploaded_files) - 4} more file(s)...")
+            
+            if st.button("⬆️ Upload All to Google Drive", type="primary", use_container_width=True):
+                progress_bar = st.progress(0)
+                status_text = st.empty()
                 
-                if st.button("⬆️ Upload All to Google Drive", type="primary", use_container_width=True):
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
+                success_count = 0
+                skipped_existing = 0
+                skipped_repeats = 0
+                uploaded_ids = []
+                futures = {}
+                folder_id = st.session_state.gdrive_folder_id or create_app_folder()
+                if not folder_id:
+                    st.error("Failed to get Google Drive folder ID")
+                else:
+                    service = st.session_state.service
+                    credentials = st.session_state.credentials
+                    upload_hashes = st.session_state.upload_hashes
+                    batch_digests = set()
+                    for uploaded_file in uploaded_files:
+                        digest = content_digest(uploaded_file)
+                        if digest in upload_hashes:
+                            skipped_existing += 1
+                            continue
+                        if digest in batch_digests:
+                            skipped_repeats += 1
+                            continue
+                        batch_digests.add(digest)
+                        future = EXECUTOR.submit(_upload_local_file, service, credentials, folder_id,
+                                                 uploaded_file, uploaded_file.name)
+                        futures[future] = (digest, uploaded_file.name)
                     
-                    success_count = 0
-                    for idx, uploaded_file in enumerate(uploaded_files):
-                        status_text.text(f"Uploading {uploaded_file.name}... ({idx + 1}/{len(uploaded_files)})")
-                        
+                    if skipped_existing:
+                        st.info(f"Skipped {skipped_existing} image(s) already in Google Drive")
+                    if skipped_repeats:
+                        st.info(f"Skipped {skipped_repeats} repeated image(s) in this selection")
+                    
+                    # Session state is only written here, on the script thread
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        digest, name = futures[future]
                         try:
-                            folder_id = st.session_state.gdrive_folder_id or create_app_folder()
-                            if not folder_id:
-                                st.error(f"Failed to get folder ID for {uploaded_file.name}")
-                                continue
-                            
-                            image_data = uploaded_file.getvalue()
-                            
-                            mime_type = 'image/png'
-                            if uploaded_file.name.lower().endswith('.jpg') or uploaded_file.name.lower().endswith('.jpeg'):
-                                mime_type = 'image/jpeg'
-                            elif uploaded_file.name.lower().endswith('.webp'):
-                                mime_type = 'image/webp'
-                            
-                            file_metadata = {
-                                'name': uploaded_file.name,
-                                'parents': [folder_id]
-                            }
-                            
-                            media = MediaIoBaseUpload(
-                                io.BytesIO(image_data),
-                                mimetype=mime_type,
-                                resumable=True
-                            )
-                            
-                            file = st.session_state.service.files().create(
-                                body=file_metadata,
-                                media_body=media,
-                                fields='id, name, webViewLink, webContentLink, mimeType, createdTime, size'
-                            ).execute()
-                            
-                            file_id = file.get('id')
-                            
-                            permission = {
-                                'type': 'anyone',
-                                'role': 'reader'
-                            }
-                            st.session_state.service.permissions().create(
-                                fileId=file_id,
-                                body=permission
-                            ).execute()
-                            
-                            public_image_url = f"https://drive.google.com/uc?export=view&id={file_id}"
-                            thumbnail_url = f"https://drive.google.com/thumbnail?id={file_id}&sz=w400"
-                            
-                            upload_info = {
-                                'file_id': file_id,
-                                'file_name': file.get('name'),
-                                'web_link': file.get('webViewLink'),
-                                'content_link': file.get('webContentLink'),
-                                'public_image_url': public_image_url,
-                                'thumbnail_url': thumbnail_url,
-                                'mime_type': file.get('mimeType'),
-                                'uploaded_at': datetime.now().isoformat(),
-                                'task_id': None,
-                                'original_url': public_image_url,
-                                'id': file_id,
-                                'name': file.get('name'),
-                                'createdTime': file.get('createdTime'),
-                                'size': file.get('size'),
-                                'mimeType': file.get('mimeType'),
-                                'thumbnailLink': thumbnail_url,
-                                'direct_link': f"https://lh3.googleusercontent.com/d/{file_id}"
-                            }
-                            
+                            upload_info = future.result()
+                            status_text.text(f"Uploaded {name} ({done}/{len(futures)})")
+                            uploaded_ids.append(upload_info['file_id'])
+                            upload_hashes[digest] = upload_info['file_id']
                             st.session_state.library_images.insert(0, upload_info)
                             st.session_state.stats['uploaded_images'] += 1
                             success_count += 1
-                            
                         except Exception as e:
-                            st.error(f"Error uploading {uploaded_file.name}: {str(e)}")
+                            forget_app_folder_if_missing(e)
+                            st.error(f"Error uploading {name}: {str(e)}")
                         
-                        progress_bar.progress((idx + 1) / len(uploaded_files))
-                    
-                    progress_bar.empty()
-                    status_text.empty()
-                    
-                    if success_count == len(uploaded_files):
-                        st.success(f"✅ Successfully uploaded all {success_count} image(s) to Google Drive!")
-                    elif success_count > 0:
-                        st.warning(f"⚠️ Uploaded {success_count} of {len(uploaded_files)} image(s)")
-                    else:
-                        st.error("❌ Failed to upload images")
-                    
-                    if success_count > 0:
-                        if st.button("📚 View in Library"):
-                            st.session_state.current_page = "Library"
-                            st.rerun()
-            else:
-                st.info("👆 Click 'Browse files' to select images from your computer")
-                st.markdown("""
-                ### Supported formats:
-                - PNG (.png)
-                - JPEG (.jpg, .jpeg)
-                - WebP (.webp)
+                        progress_bar.progress(done / len(futures))
+                
+                try:
+                    make_files_public(uploaded_ids)
+                except Exception as e:
+                    st.warning(f"Error sharing uploaded files: {str(e)}")
+                
+                if uploaded_ids:
+                    invalidate_gdrive_cache()
+                
+                progress_bar.empty()
+                status_text.empty()
+                
+                if folder_id and not futures:
+                    st.info("No new images to upload")
+                elif success_count and success_count == len(futures):
+                    st.success(f"✅ Successfully uploaded all {success_count} new image(s) to Google Drive!")
+                elif success_count > 0:
+                    st.warning(f"⚠️ Uploaded {success_count} of {len(futures)} new image(s)")
+                else:
+                    st.error("❌ Failed to upload images")
                 
-                Upload multiple images at once to quickly populate your library!
-                """)
+                if success_count > 0:
+                    if st.button("📚 View in Library"):
+                        st.session_state.current_page = "Library"
+                        st.rerun()
+        else:
+            st.info("👆 Click 'Browse files' to select images from your computer")
+            st.markdown("""
+            ### Supported formats:
+            - PNG (.png)
+            - JPEG (.jpg, .jpeg)
+            - WebP (.webp)
+            
+            Upload multiple images at once to quickly populate your library!
+            """)
+
+def render_advanced_tab():
+    """Render the Advanced tab."""
+    st.header("Advanced Generation Options")
+    st.info("Additional generation models and options coming soon!")
+    
+    st.markdown("""
+    ### Available Features:
+    - **Inpainting**: Edit specific areas of an image
+    - **Outpainting**: Extend image boundaries
+    - **Style Transfer**: Apply artistic styles to images
+    - **Image Enhancement**: Upscale and enhance image quality
+    
+    More features will be added soon!
+    """)
+
+def display_generate_page():
+    st.title("✨ Generate New Image")
+    
+    if 'selected_prompt_for_generation' in st.session_state and st.session_state.get('selected_prompt_for_generation'):
+        st.success(f"📋 Using prompt from library: {st.session_state.selected_prompt_for_generation[:60]}...")
+        if st.button("❌ Clear Selected Prompt"):
+            st.session_state.selected_prompt_for_generation = None
+            st.rerun()
+    
+    if st.session_state.selected_image_for_edit and st.session_state.edit_mode:
+        st.info(f"📷 Image selected for editing: {st.session_state.selected_image_for_edit.get('name', 'Unknown')}")
+        if st.button("❌ Clear Selection"):
+            st.session_state.selected_image_for_edit = None
+            st.session_state.edit_mode = None
+            st.rerun()
+    
+    if not st.session_state.api_key:
+        st.error("Please configure your API Key in the sidebar to start generating images.")
+        return
+
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Text-to-Image", "Image Edit (Qwen)", "Image Edit (Seedream)", "Upload Images", "Advanced"])
+
+    with tab1:
+        render_text_to_image_tab()
+
+    with tab2:
+        render_qwen_edit_tab()
+
+    with tab3:
+        render_seedream_edit_tab()
+
+    with tab4:
+        render_upload_tab()
 
     with tab5:
-        st.header("Advanced Generation Options")
-        st.info("Additional generation models and options coming soon!")
+        render_advanced_tab()
+
+@st.fragment(run_every=POLL_REFRESH_INTERVAL)
+def render_poll_progress(task_id):
+    """Show live progress for a background poll; rerun the app once it finishes."""
+    job = st.session_state.poll_jobs.get(task_id)
+    if job is None:
+        return
+    
+    future, status = job
+    if future.done():
+        st.rerun()
+    
+    st.progress(min(status['elapsed'] / POLL_TIMEOUT, 0.95))
+    st.caption(f"Status: {status['state']} | Checks: {status['attempts']} | {status['elapsed']:.0f}s elapsed")
+
+def collect_finished_polls():
+    """Apply the results of every background poll that has finished.
+    
+    Runs for all tasks, not only the one shown in detail, so results land
+    in history (and Drive) whichever row is selected.
+    """
+    tasks_by_id = {task['id']: task for task in st.session_state.task_history}
+    
+    for task_id, (future, _) in list(st.session_state.poll_jobs.items()):
+        if not future.done():
+            continue
+        del st.session_state.poll_jobs[task_id]
+        task = tasks_by_id.get(task_id)
+        if task is None:
+            continue
+        
+        result = future.result()
+        if result["success"]:
+            try:
+                result_urls = parse_result_urls(result['data'])
+                save_and_upload_results(task['id'], task['model'], task['prompt'], result_urls)
+                st.success(f"Task {task_id} completed and results saved!")
+            except json.JSONDecodeError:
+                st.error(f"Failed to parse result JSON for {task_id}")
+                task['status'] = 'fail'
+                persist_task(task)
+                st.session_state.stats['failed_tasks'] += 1
+        else:
+            task['status'] = 'fail'
+            task['error'] = result['error']
+            persist_task(task)
+            st.session_state.stats['failed_tasks'] += 1
+            st.error(f"Task {task_id} failed: {result['error']}")
+
+@st.fragment(run_every=POLL_REFRESH_INTERVAL)
+def render_poll_watch():
+    """Rerun the page as soon as any background poll finishes."""
+    jobs = st.session_state.poll_jobs
+    if any(future.done() for future, _ in jobs.values()):
+        st.rerun()
+    if jobs:
+        st.caption(f"⏳ {len(jobs)} task(s) being checked in the background")
+
+def render_task_detail(task):
+    """Full view of one history entry: status, polling and results."""
+    st.subheader(f"Task ID: {task['id']}")
+    
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+    col1.markdown(f"**Model:** {task['model']}")
+    col2.markdown(f"**Prompt:** {task['prompt'][:50]}...")
+    col3.markdown(f"**Status:** <span class='status-badge status-{task['status']}'>{task['status'].upper()}</span>", unsafe_allow_html=True)
+    col4.markdown(f"**Created:** {short_timestamp(task['created_at'])}")
+    
+    if task['status'] == 'waiting' or task['status'] == 'processing':
+        job = st.session_state.poll_jobs.get(task['id'])
         
-        st.markdown("""
-        ### Available Features:
-        - **Inpainting**: Edit specific areas of an image
-        - **Outpainting**: Extend image boundaries
-        - **Style Transfer**: Apply artistic styles to images
-        - **Image Enhancement**: Upscale and enhance image quality
+        if job is None:
+            full = len(st.session_state.poll_jobs) >= MAX_SESSION_POLLS
+            if st.button(f"Check Status for {task['id']}", key=f"check_{task['id']}", disabled=full,
+                         help=f"At most {MAX_SESSION_POLLS} tasks are checked at once" if full else None):
+                start_task_polling(st.session_state.api_key, task['id'])
+                st.rerun()
+        else:
+            render_poll_progress(task['id'])
+    
+    elif task['status'] == 'success' and task['results']:
+        st.markdown("#### Results")
+        cols = st.columns(len(task['results']))
+        uploaded_urls = {lib_img.get('original_url') for lib_img in st.session_state.library_images}
         
-        More features will be added soon!
-        """)
+        for j, result_url in enumerate(task['results']):
+            with cols[j]:
+                try:
+                    image_bytes = fetch_image_bytes(result_url)
+                except Exception as e:
+                    image_bytes = None
+                    st.warning(f"Download unavailable: {str(e)}")
+                
+                st.image(image_bytes or result_url, caption=f"Result {j+1}", use_container_width=True)
+                
+                if st.session_state.authenticated:
+                    if result_url not in uploaded_urls:
+                        upload_key = f"upload_{task['id']}_{j}"
+                        if st.button("⬆️ Upload to Drive", key=upload_key, use_container_width=True):
+                            file_name = f"{task['model'].replace('/', '_')}_{task['id']}_{j+1}.png"
+                            with st.spinner(f"Uploading {file_name}..."):
+                                upload_info = upload_to_gdrive(result_url, file_name, task['id'])
+                                if upload_info:
+                                    st.session_state.library_images.insert(0, upload_info)
+                                    st.success(f"Uploaded {file_name} to Drive!")
+                                    st.rerun()
+                                else:
+                                    st.error("Upload failed.")
+                    else:
+                        st.success("✅ In Drive")
+                
+                if image_bytes:
+                    st.download_button(
+                        label="⬇️ Download",
+                        data=image_bytes,
+                        file_name=f"{task['model'].replace('/', '_')}_{task['id']}_{j+1}.png",
+                        mime="image/png",
+                        key=f"download_{task['id']}_{j}",
+                        use_container_width=True
+                    )
+    
+    elif task['status'] == 'fail':
+        st.error(f"Failure reason: {task.get('error', 'Unknown error')}")
 
 def display_history_page():
     st.title("📋 Task History")
@@ -1298,100 +2295,49 @@ def display_history_page():
         st.info("No tasks in history yet.")
         return
     
-    if st.session_state.polling_active:
-        st.warning("Polling is currently active for a task. Please wait.")
+    collect_finished_polls()
     
-    for i, task in enumerate(st.session_state.task_history):
-        st.subheader(f"Task ID: {task['id']}")
-        
-        col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
-        col1.markdown(f"**Model:** {task['model']}")
-        col2.markdown(f"**Prompt:** {task['prompt'][:50]}...")
-        col3.markdown(f"**Status:** <span class='status-badge status-{task['status']}'>{task['status'].upper()}</span>", unsafe_allow_html=True)
-        col4.markdown(f"**Created:** {datetime.fromisoformat(task['created_at']).strftime('%Y-%m-%d %H:%M')}")
-        
-        if task['status'] == 'waiting' or task['status'] == 'processing':
-            if not st.session_state.polling_active:
-                if st.button(f"Check Status for {task['id']}", key=f"check_{task['id']}"):
-                    st.session_state.polling_active = True
-                    st.session_state.current_task = task['id']
-                    st.rerun()
-            
-            if st.session_state.current_task == task['id'] and st.session_state.polling_active:
-                st.info("Polling for task status...")
-                
-                result = poll_task_until_complete(st.session_state.api_key, task['id'])
-                
-                st.session_state.polling_active = False
-                st.session_state.current_task = None
-                
-                if result["success"]:
-                    try:
-                        result_json = json.loads(result['data'].get('resultJson', '{}'))
-                        result_urls = result_json.get('resultUrls', [])
-                        
-                        save_and_upload_results(task['id'], task['model'], task['prompt'], result_urls)
-                        
-                        st.success("Task completed and results saved!")
-                        st.rerun()
-                    except json.JSONDecodeError:
-                        st.error("Failed to parse result JSON")
-                        st.session_state.task_history[i]['status'] = 'fail'
-                        st.session_state.stats['failed_tasks'] += 1
-                        st.rerun()
-                else:
-                    st.session_state.task_history[i]['status'] = 'fail'
-                    st.session_state.task_history[i]['error'] = result['error']
-                    st.session_state.stats['failed_tasks'] += 1
-                    st.error(f"Task failed: {result['error']}")
-                    st.rerun()
-        
-        elif task['status'] == 'success':
-            st.markdown("#### Results")
-            cols = st.columns(len(task['results']))
-            
-            for j, result_url in enumerate(task['results']):
-                with cols[j]:
-                    st.image(result_url, caption=f"Result {j+1}", use_container_width=True)
-                    
-                    if st.session_state.authenticated:
-                        is_uploaded = any(
-                            lib_img.get('original_url') == result_url 
-                            for lib_img in st.session_state.library_images
-                        )
-                        
-                        if not is_uploaded:
-                            upload_key = f"upload_{task['id']}_{j}"
-                            if st.button("⬆️ Upload to Drive", key=upload_key, use_container_width=True):
-                                file_name = f"{task['model'].replace('/', '_')}_{task['id']}_{j+1}.png"
-                                with st.spinner(f"Uploading {file_name}..."):
-                                    upload_info = upload_to_gdrive(result_url, file_name, task['id'])
-                                    if upload_info:
-                                        st.session_state.library_images.insert(0, upload_info)
-                                        st.success(f"Uploaded {file_name} to Drive!")
-                                        st.rerun()
-                                    else:
-                                        st.error("Upload failed.")
-                        else:
-                            st.success("✅ In Drive")
-                    
-                    try:
-                        img_response = requests.get(result_url, timeout=10)
-                        st.download_button(
-                            label="⬇️ Download",
-                            data=img_response.content,
-                            file_name=f"{task['model'].replace('/', '_')}_{task['id']}_{j+1}.png",
-                            mime="image/png",
-                            key=f"download_{task['id']}_{j}",
-                            use_container_width=True
-                        )
-                    except Exception as e:
-                        st.warning(f"Download unavailable: {str(e)}")
-        
-        elif task['status'] == 'fail':
-            st.error(f"Failure reason: {task.get('error', 'Unknown error')}")
-        
-        st.markdown("---")
+    unpolled = [task['id'] for task in st.session_state.task_history
+                if task['status'] in ('waiting', 'processing') and task['id'] not in st.session_state.poll_jobs]
+    room = MAX_SESSION_POLLS - len(st.session_state.poll_jobs)
+    if len(unpolled) > 1 and room > 0:
+        batch = unpolled[:room]
+        if st.button(f"🔄 Check all pending ({len(batch)} of {len(unpolled)})", key="check_all_pending"):
+            # Polls run side by side on the poll executor, at most
+            # MAX_SESSION_POLLS at a time; the rest wait for the next click
+            for task_id in batch:
+                start_task_polling(st.session_state.api_key, task_id)
+            st.rerun()
+    
+    if st.session_state.poll_jobs:
+        render_poll_watch()
+    
+    # One table for the whole history; only the selected task gets the
+    # widget-heavy detail view
+    tasks = list(st.session_state.task_history)
+    rows = [
+        {
+            "": HISTORY_STATUS_ICONS.get(task['status'], '⚪'),
+            "Task ID": task['id'],
+            "Model": task['model'],
+            "Status": task['status'],
+            "Created": short_timestamp(task['created_at']),
+            "Prompt": task['prompt']
+        }
+        for task in tasks
+    ]
+    event = st.dataframe(rows, hide_index=True, use_container_width=True,
+                         on_select="rerun", selection_mode="single-row", key="history_table")
+    
+    selected_rows = event.selection.rows
+    if selected_rows and selected_rows[0] < len(tasks):
+        task = tasks[selected_rows[0]]
+    else:
+        task = tasks[0]
+        st.caption("Select a row to see its details. Showing the newest task.")
+    
+    st.markdown("---")
+    render_task_detail(task)
 
 def display_library_page():
     st.title("📚 Google Drive Library")
@@ -1405,7 +2351,7 @@ def display_library_page():
     with col2:
         if st.button("🔄 Refresh Library", use_container_width=True):
             with st.spinner("Refreshing..."):
-                st.session_state.library_images = list_gdrive_images()
+                st.session_state.library_images = list_gdrive_images(refresh=True)
                 st.success("Library refreshed!")
                 st.rerun()
     
@@ -1426,9 +2372,6 @@ def display_library_page():
             st.rerun()
         return
 
-    valid_images = [img for img in st.session_state.library_images 
-                   if img and 'name' in img and 'id' in img]
-    
     with st.container():
         st.markdown("<div class='filter-panel'>", unsafe_allow_html=True)
         
@@ -1439,92 +2382,119 @@ def display_library_page():
                                         value=st.session_state.library_search_query,
                                         placeholder="Type to search...",
                                         key="library_search")
+            if search_query != st.session_state.library_search_query:
+                st.session_state.library_page = 0
             st.session_state.library_search_query = search_query
         
+        # Radios are bound straight to session state through their keys
         with filter_col2:
-            sort_options = {
-                'date_desc': '📅 Newest First',
-                'date_asc': '📅 Oldest First',
-                'name_asc': '🔤 Name A-Z',
-                'name_desc': '🔤 Name Z-A'
-            }
-            sort_by = st.selectbox("Sort by", 
-                                  options=list(sort_options.keys()),
-                                  format_func=lambda x: sort_options[x],
-                                  index=list(sort_options.keys()).index(st.session_state.library_sort_by),
-                                  key="library_sort")
-            st.session_state.library_sort_by = sort_by
+            st.radio("Sort by",
+                     options=tuple(LIBRARY_SORT_OPTIONS),
+                     format_func=LIBRARY_SORT_OPTIONS.get,
+                     horizontal=True,
+                     key="library_sort_by",
+                     on_change=change_library_page,
+                     args=(None,))
         
         with filter_col3:
-            filter_options = {
-                'all': '🖼️ All Types',
-                'png': '🖼️ PNG Only',
-                'jpg': '🖼️ JPG Only',
-                'webp': '🖼️ WebP Only'
-            }
-            filter_type = st.selectbox("Filter", 
-                                      options=list(filter_options.keys()),
-                                      format_func=lambda x: filter_options[x],
-                                      index=list(filter_options.keys()).index(st.session_state.library_filter_type),
-                                      key="library_filter")
-            st.session_state.library_filter_type = filter_type
+            st.radio("Filter",
+                     options=tuple(LIBRARY_FILTER_OPTIONS),
+                     format_func=LIBRARY_FILTER_OPTIONS.get,
+                     horizontal=True,
+                     key="library_filter_type",
+                     on_change=change_library_page,
+                     args=(None,))
         
         with filter_col4:
-            view_options = {
-                'grid': '⊞ Grid View',
-                'list': '≡ List View'
-            }
-            view_mode = st.selectbox("View", 
-                                    options=list(view_options.keys()),
-                                    format_func=lambda x: view_options[x],
-                                    index=list(view_options.keys()).index(st.session_state.library_view_mode),
-                                    key="library_view")
-            st.session_state.library_view_mode = view_mode
+            st.radio("View",
+                     options=tuple(LIBRARY_VIEW_OPTIONS),
+                     format_func=LIBRARY_VIEW_OPTIONS.get,
+                     horizontal=True,
+                     key="library_view_mode")
         
         st.markdown("</div>", unsafe_allow_html=True)
     
-    filtered_images = valid_images
+    render_library_items()
+
+def change_library_page(step: Optional[int]):
+    """Move the library page by ``step``; ``None`` resets to the first page."""
+    if step is None:
+        st.session_state.library_page = 0
+    else:
+        st.session_state.library_page = max(0, st.session_state.library_page + step)
+
+def toggle_library_selection(file_id: str, widget_key: str):
+    """Sync a tile's select checkbox into the bulk-delete selection."""
+    if st.session_state[widget_key]:
+        st.session_state.library_selected.add(file_id)
+    else:
+        st.session_state.library_selected.discard(file_id)
+
+def clear_library_selection(file_ids=None):
+    """Untick ``file_ids`` (default: everything) and drop their checkbox state."""
+    file_ids = set(st.session_state.library_selected if file_ids is None else file_ids)
+    st.session_state.library_selected -= file_ids
+    for file_id in file_ids:
+        st.session_state.pop(f"select_{file_id}", None)
+        st.session_state.pop(f"list_select_{file_id}", None)
+
+@st.fragment
+def render_library_items():
+    """Render the filtered library grid/list.
+    
+    Runs as a fragment so deleting a tile only reruns this part of the page.
+    """
+    collect_finished_deletes()
     
-    if st.session_state.library_search_query:
-        filtered_images = [img for img in filtered_images 
-                          if st.session_state.library_search_query.lower() in img.get('name', '').lower()]
+    filtered_images = filter_and_sort_library(st.session_state.library_search_query,
+                                              st.session_state.library_filter_type,
+                                              st.session_state.library_sort_by)
     
-    if st.session_state.library_filter_type != 'all':
-        mime_type_map = {
-            'png': 'image/png',
-            'jpg': ['image/jpeg', 'image/jpg'],
-            'webp': 'image/webp'
-        }
-        target_mime = mime_type_map[st.session_state.library_filter_type]
-        if isinstance(target_mime, list):
-            filtered_images = [img for img in filtered_images 
-                             if img.get('mimeType') in target_mime]
-        else:
-            filtered_images = [img for img in filtered_images 
-                             if img.get('mimeType') == target_mime]
-    
-    if st.session_state.library_sort_by == 'date_desc':
-        filtered_images = sorted(filtered_images, 
-                                key=lambda x: x.get('createdTime', ''), 
-                                reverse=True)
-    elif st.session_state.library_sort_by == 'date_asc':
-        filtered_images = sorted(filtered_images, 
-                                key=lambda x: x.get('createdTime', ''))
-    elif st.session_state.library_sort_by == 'name_asc':
-        filtered_images = sorted(filtered_images, 
-                                key=lambda x: x.get('name', '').lower())
-    elif st.session_state.library_sort_by == 'name_desc':
-        filtered_images = sorted(filtered_images, 
-                                key=lambda x: x.get('name', '').lower(), 
-                                reverse=True)
-    
-    st.markdown(f"Showing **{len(filtered_images)}** of **{len(valid_images)}** images")
-    st.markdown("---")
+    st.markdown(f"Showing **{len(filtered_images)}** of **{len(st.session_state.library_images)}** images")
     
     if not filtered_images:
+        st.markdown("---")
         st.info("No images match your search criteria.")
         return
     
+    # Only one page of tiles is rendered; filtering and sorting stay global
+    page_size = st.session_state.library_page_size
+    total_pages = max(1, math.ceil(len(filtered_images) / page_size))
+    page = min(st.session_state.library_page, total_pages - 1)
+    st.session_state.library_page = page
+    
+    # Results that fit on the smallest page never need the pager
+    if len(filtered_images) > LIBRARY_PAGE_SIZES[0]:
+        nav_col1, nav_col2, nav_col3, nav_col4 = st.columns([1, 2, 1, 1])
+        with nav_col1:
+            st.button("⬅️ Prev", key="library_prev_page", use_container_width=True,
+                      disabled=page == 0, on_click=change_library_page, args=(-1,))
+        with nav_col2:
+            st.markdown(f"Page **{page + 1}** of **{total_pages}**")
+        with nav_col3:
+            st.button("Next ➡️", key="library_next_page", use_container_width=True,
+                      disabled=page >= total_pages - 1, on_click=change_library_page, args=(1,))
+        with nav_col4:
+            st.selectbox("Per page", LIBRARY_PAGE_SIZES, key="library_page_size",
+                         label_visibility="collapsed", on_change=change_library_page, args=(None,))
+    
+    selected = st.session_state.library_selected
+    if selected:
+        sel_col1, sel_col2 = st.columns([1, 1])
+        with sel_col1:
+            st.button(f"🗑️ Delete selected ({len(selected)})", key="library_delete_selected",
+                      type="primary", use_container_width=True,
+                      on_click=delete_library_images, args=(list(selected),))
+        with sel_col2:
+            st.button("Clear selection", key="library_clear_selection", use_container_width=True,
+                      on_click=clear_library_selection)
+    
+    st.markdown("---")
+    
+    filtered_images = filtered_images[page * page_size:(page + 1) * page_size]
+    # Fetch the page's thumbnails in parallel rather than one tile at a time
+    thumbnails = list(EXECUTOR.map(tile_thumbnail, filtered_images))
+    
     if st.session_state.library_view_mode == 'grid':
         cols_per_row = 3
         
@@ -1549,26 +2519,15 @@ def display_library_page():
                 with st.container():
                     st.markdown(f"<div class='image-card'>", unsafe_allow_html=True)
                     
-                    image_displayed = False
-                    urls_to_try = [
-                        original_url,  # Original generation URL (highest quality)
-                        public_image_url,  # Google Drive public URL
-                        thumbnail_url,  # Google Drive thumbnail
-                        direct_link  # Google Drive direct link
-                    ]
-                    
-                    for url in urls_to_try:
-                        if url and not image_displayed:
-                            try:
-                                st.image(url, use_container_width=True, caption=file_name)
-                                image_displayed = True
-                                break
-                            except Exception:
-                                continue
-                    
-                    if not image_displayed:
+                    if thumbnails[i]:
+                        st.image(thumbnails[i], use_container_width=True, caption=file_name)
+                    else:
                         st.markdown(f"<div class='image-container'><div class='image-placeholder'>🖼️<br>Preview unavailable<br><a href='{web_link}' target='_blank'>Open in Drive</a></div></div>", unsafe_allow_html=True)
                     
+                    st.checkbox("Select", value=file_id in st.session_state.library_selected,
+                                key=f"select_{file_id}", on_change=toggle_library_selection,
+                                args=(file_id, f"select_{file_id}"))
+                    
                     st.markdown("<div class='image-info'>", unsafe_allow_html=True)
                     
                     if original_url:
@@ -1578,11 +2537,7 @@ def display_library_page():
                         st.markdown(f"<a href='{public_image_url}' target='_blank'><span class='metadata-badge' style='background:#4285F4;color:white;cursor:pointer;'>☁️ Drive</span></a>", unsafe_allow_html=True)
                     
                     if created_time:
-                        try:
-                            created_date = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
-                            st.markdown(f"<span class='metadata-badge'>📅 {created_date.strftime('%Y-%m-%d %H:%M')}</span>", unsafe_allow_html=True)
-                        except:
-                            pass
+                        st.markdown(f"<span class='metadata-badge'>📅 {short_timestamp(created_time)}</span>", unsafe_allow_html=True)
                     
                     if file_size:
                         try:
@@ -1630,14 +2585,8 @@ def display_library_page():
                             st.markdown(f"<a href='{view_url}' target='_blank' style='text-decoration:none;'><button style='width:100%;padding:8px;background:#34A853;color:white;border:none;border-radius:6px;cursor:pointer;'>👁️ View</button></a>", unsafe_allow_html=True)
                     
                     with btn_col3:
-                        if st.button("🗑️", key=f"delete_{file_id}", use_container_width=True, help="Delete this image"):
-                            with st.spinner(f"Deleting {file_name}..."):
-                                if delete_gdrive_file(file_id):
-                                    st.success(f"✅ Deleted {file_name}")
-                                    st.session_state.library_images = [img for img in st.session_state.library_images if img.get('id') != file_id]
-                                    st.rerun()
-                                else:
-                                    st.error("❌ Failed to delete file.")
+                        st.button("🗑️", key=f"delete_{file_id}", use_container_width=True, help="Delete this image",
+                                  on_click=delete_library_images, args=([file_id],))
                     
                     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -1662,21 +2611,14 @@ def display_library_page():
                 col1, col2 = st.columns([1, 3])
                 
                 with col1:
-                    # Thumbnail - try original first, then Drive thumbnails
-                    image_displayed = False
-                    urls_to_try = [original_url, thumbnail_url, public_image_url, direct_link]
-                    
-                    for url in urls_to_try:
-                        if url and not image_displayed:
-                            try:
-                                st.image(url, width=150)
-                                image_displayed = True
-                                break
-                            except Exception:
-                                continue
-                    
-                    if not image_displayed:
+                    if thumbnails[i]:
+                        st.image(thumbnails[i], width=150)
+                    else:
                         st.markdown("🖼️ No preview")
+                    
+                    st.checkbox("Select", value=file_id in st.session_state.library_selected,
+                                key=f"list_select_{file_id}", on_change=toggle_library_selection,
+                                args=(file_id, f"list_select_{file_id}"))
                 
                 with col2:
                     st.markdown(f"### {file_name}")
@@ -1690,11 +2632,7 @@ def display_library_page():
                     # Metadata
                     metadata_html = link_badges
                     if created_time:
-                        try:
-                            created_date = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
-                            metadata_html += f"<span class='metadata-badge'>📅 {created_date.strftime('%Y-%m-%d %H:%M')}</span> "
-                        except:
-                            pass
+                        metadata_html += f"<span class='metadata-badge'>📅 {short_timestamp(created_time)}</span> "
                     
                     if file_size:
                         try:
@@ -1741,14 +2679,8 @@ def display_library_page():
                             st.markdown(f"<a href='{view_url}' target='_blank' style='text-decoration:none;'><button style='width:100%;padding:8px;background:#34A853;color:white;border:none;border-radius:6px;cursor:pointer;'>👁️ View</button></a>", unsafe_allow_html=True)
                     
                     with btn_col5:
-                        if st.button("🗑️ Delete", key=f"list_delete_{file_id}", use_container_width=True):
-                            with st.spinner(f"Deleting {file_name}..."):
-                                if delete_gdrive_file(file_id):
-                                    st.success(f"✅ Deleted {file_name}")
-                                    st.session_state.library_images = [img for img in st.session_state.library_images if img.get('id') != file_id]
-                                    st.rerun()
-                                else:
-                                    st.error("❌ Failed to delete file.")
+                        st.button("🗑️ Delete", key=f"list_delete_{file_id}", use_container_width=True,
+                                  on_click=delete_library_images, args=([file_id],))
                 
                 st.markdown("</div>", unsafe_allow_html=True)
                 st.markdown("---")